@@ -22,6 +22,7 @@ as a tool in a terminal.
 import argparse
 import logging
 import os
+import re
 import shlex
 import sys
 import traceback
@@ -71,6 +72,16 @@ def main():
         sys.exit(0)
     if args.default_font:
         svg.Text.default_font = args.default_font
+    if args.stroke_font:
+        svg.Text.use_stroke_font = True
+    elif has_text( args.input_file_name ):
+        # Find the installed fonts while the svg is being parsed
+        svg.Text.start_font_discovery()
+
+    svg.ResourceLimits.max_elements = args.max_elements
+    svg.ResourceLimits.max_path_commands = args.max_path_commands
+    svg.ResourceLimits.max_vertices = args.max_vertices
+    svg.ResourceLimits.max_stage_time = args.time_limit
 
     pretty = args.format in ['pretty','latest']
     use_mm = args.units == 'mm'
@@ -81,6 +92,10 @@ def main():
             logger.critical("Error: decimal units only allowed with legacy output type")
             sys.exit( -1 )
 
+    if args.native_text and args.format != "latest":
+        logger.critical("Error: native text is only supported with the latest output type")
+        sys.exit( -1 )
+
     try:
         # Import the SVG:
         imported = Svg2ModImport(
@@ -116,6 +131,9 @@ def main():
                 args.precision,
                 dpi = args.dpi,
                 pads = args.convert_to_pads,
+                native_text = args.native_text,
+                validate = args.validate,
+                merge_fills = args.merge_fills,
             )
 
         else:
@@ -132,6 +150,8 @@ def main():
                         args.scale_factor,
                         args.precision,
                         args.dpi,
+                        validate = args.validate,
+                        merge_fills = args.merge_fills,
                     )
 
                 except Exception as e:
@@ -147,6 +167,8 @@ def main():
                     args.precision,
                     use_mm = use_mm,
                     dpi = args.dpi,
+                    validate = args.validate,
+                    merge_fills = args.merge_fills,
                 )
 
         cmd_args = [os.path.basename(sys.argv[0])] + sys.argv[1:]
@@ -154,6 +176,13 @@ def main():
 
         # Export the footprint:
         exported.write(cmdline)
+
+        if exported.invalid:
+            logger.critical(f"Validation failed: {len(exported.invalid)} polygons cross themselves")
+            sys.exit( -1 )
+    except svg.ResourceLimitError as e:
+        logger.critical(f"Stopped converting {args.input_file_name}: {e}")
+        exit(-1)
     except Exception as e:
         if args.debug_print:
             traceback.print_exc()
@@ -163,6 +192,18 @@ def main():
 
 #----------------------------------------------------------------------------
 
+def has_text( file_name ):
+    '''Quickly check if the svg file has any text elements
+    without parsing it.
+    '''
+    try:
+        with open( file_name, 'rb' ) as svg_file:
+            return re.search( rb"<(\w+:)?text[\s>/]", svg_file.read() ) is not None
+    except (OSError, TypeError):
+        return False
+
+#----------------------------------------------------------------------------
+
 def get_arguments():
     ''' Return an instance of pythons argument parser
     with all the command line functionalities arguments
@@ -325,6 +366,78 @@ def get_arguments():
         help = "Default font to use if the target font in a text element cannot be found",
     )
 
+    parser.add_argument(
+        '--stroke-font',
+        dest = 'stroke_font',
+        action = 'store_const',
+        const = True,
+        help = "Use the built-in stroke font for all text instead of searching for installed fonts",
+        default = False,
+    )
+
+    parser.add_argument(
+        '--max-elements',
+        type = int,
+        dest = 'max_elements',
+        metavar = 'COUNT',
+        help = "Stop if the SVG has more than COUNT elements",
+        default = None,
+    )
+
+    parser.add_argument(
+        '--max-path-commands',
+        type = int,
+        dest = 'max_path_commands',
+        metavar = 'COUNT',
+        help = "Stop if all path data has more than COUNT commands and numbers",
+        default = None,
+    )
+
+    parser.add_argument(
+        '--max-vertices',
+        type = int,
+        dest = 'max_vertices',
+        metavar = 'COUNT',
+        help = "Flatten curves more coarsely, then stop, to stay below COUNT points",
+        default = None,
+    )
+
+    parser.add_argument(
+        '--time-limit',
+        type = float,
+        dest = 'time_limit',
+        metavar = 'SECONDS',
+        help = "Stop if parsing or writing takes longer than SECONDS",
+        default = None,
+    )
+
+    parser.add_argument(
+        '--native-text',
+        dest = 'native_text',
+        action = 'store_const',
+        const = True,
+        help = "Write text as native kicad text instead of outlines (requires --format latest and kicad >= 7)",
+        default = False,
+    )
+
+    parser.add_argument(
+        '--merge-fills',
+        dest = 'merge_fills',
+        action = 'store_const',
+        const = True,
+        help = "Merge overlapping filled shapes on a layer and follow their fill-rule",
+        default = False,
+    )
+
+    parser.add_argument(
+        '--validate',
+        dest = 'validate',
+        action = 'store_const',
+        const = True,
+        help = "Check that filled polygons do not cross themselves and exit with an error if any do",
+        default = False,
+    )
+
     mux.add_argument(
         '-l', '--list-fonts',
         dest = 'list_fonts',
@@ -24,6 +24,7 @@ import copy
 import datetime
 import io
 import json
+import math
 import os
 import re
 import time
@@ -32,7 +33,8 @@ from abc import ABC, abstractmethod
 from svg2mod import svg
 from svg2mod.coloredlogger import logger, unfiltered_logger
 from svg2mod.importer import Svg2ModImport
-from svg2mod.svg2mod import PolygonSegment
+from svg2mod.svg.geometry import clip_polygon, clip_polyline, is_convex, signed_area
+from svg2mod.svg2mod import PolygonSegment, PolygonUnion
 
 #----------------------------------------------------------------------------
 
@@ -89,6 +91,11 @@ class Svg2ModExport(ABC):
     @abstractmethod
     def _write_thru_hole( self, circle, layer ):pass
 
+    def _write_text( self, text, layer, flip ): # pylint: disable=unused-argument
+        '''Write a Text element as native text. Returns False if
+        it has to be written as outlines instead.'''
+        return False
+
     #------------------------------------------------------------------------
 
     @staticmethod
@@ -141,6 +148,9 @@ class Svg2ModExport(ABC):
         use_mm = True,
         dpi = DEFAULT_DPI,
         pads = False,
+        native_text = False,
+        validate = False,
+        merge_fills = False,
     ):
         if use_mm:
             # 25.4 mm/in;
@@ -158,12 +168,22 @@ class Svg2ModExport(ABC):
         self.use_mm = use_mm
         self.dpi = dpi
         self.convert_pads = pads
+        self.native_text = native_text
+        self.validate = validate
+        self.merge_fills = merge_fills
+
+        # Smallest step written: 1 nm, or 0.1 mil in decimal units
+        self.resolution = 1e-6 if use_mm else 1
 
         # Local instance variables
         self.translation = None
         self.layers = {}
         self.output_file = None
         self.raw_file_data = None
+        self._clip_regions = {}
+        self._fills = {}
+        # (svg ids, layer) of the polygons that cross themselves
+        self.invalid = []
 
 
     #------------------------------------------------------------------------
@@ -273,12 +293,84 @@ class Svg2ModExport(ABC):
 
     #------------------------------------------------------------------------
 
-    def _write_items( self, items, layer, flip = False ):
+    def _get_clip_regions( self, clip ):
+        ''' Flatten a clip path once per export.
+        Returns the clip rings and if they can be used for exact clipping.
+        '''
+
+        regions = self._clip_regions.get( id( clip ) )
+        if regions is None:
+            rings = clip.regions( self.precision )
+            convex = bool( rings ) and all( is_convex( ring ) for ring in rings )
+            if not convex:
+                logger.warning(
+                    "Clip path {} is not convex. Only elements fully outside of it are removed.".format(
+                        clip.id ) )
+            regions = ( rings, convex )
+            self._clip_regions[ id( clip ) ] = regions
+        return regions
+
+    #------------------------------------------------------------------------
+
+    @staticmethod
+    def _outside_clips( item, clips ):
+        ''' Check the bounding box of item against the bounding box of each clip path '''
+
+        item_min, item_max = item.bbox()
+        for clip in clips:
+            clip_min, clip_max = clip.bbox()
+            if (
+                item_max.x < clip_min.x or item_min.x > clip_max.x or
+                item_max.y < clip_min.y or item_min.y > clip_max.y
+            ):
+                return True
+        return False
+
+    #------------------------------------------------------------------------
+
+    def _clip_segments( self, segments, clips, fill ):
+        ''' Clip flattened segments to the convex clip paths.
+        Filled segments are clipped as polygons and
+        everything else as poly-lines.
+        '''
+
+        for clip in clips:
+            rings, convex = self._get_clip_regions( clip )
+            if not convex:
+                continue
+
+            clipped = []
+            for segment in segments:
+                for ring in rings:
+                    if fill:
+                        piece = clip_polygon( segment, ring )
+                        if len( piece ) > 2:
+                            clipped.append( piece )
+                    else:
+                        clipped.extend( clip_polyline( segment, ring ) )
+            segments = clipped
+
+        return segments
+
+    #------------------------------------------------------------------------
+
+    def _write_items( self, items, layer, flip = False, clips = () ):
 
         for item in items:
 
+            svg.ResourceLimits.check_time()
+
+            item_clips = clips
+            if getattr( item, "clip_path", None ) is not None:
+                item_clips = clips + ( item.clip_path, )
+
+            # Reject anything outside of the clip before flattening it
+            if item_clips and self._outside_clips( item, item_clips ):
+                logger.debug( "  Skipping {} outside of its clip path".format( item.__class__.__name__ ) )
+                continue
+
             if isinstance( item, svg.Group ):
-                self._write_items( item.items, layer, flip )
+                self._write_items( item.items, layer, flip, item_clips )
                 continue
 
             if re.match(r"^Drill\.\w+", str(layer)):
@@ -287,14 +379,17 @@ class Svg2ModExport(ABC):
                 else:
                     logger.warning( "Non Circle SVG element in drill layer: {}".format(item.__class__.__name__))
 
+            elif (
+                isinstance( item, svg.Text ) and self.native_text and not item_clips and
+                self._write_text( item, layer, flip )
+            ):
+                logger.debug( "  Writing Text as native text" )
+
             elif isinstance( item, (svg.Path, svg.Ellipse, svg.Rect, svg.Text, svg.Polygon)):
 
-                segments = [
-                    PolygonSegment( segment )
-                    for segment in item.segments(
-                        precision = self.precision
-                    )
-                ]
+                if isinstance( item, svg.Text ):
+                    # Runs in the built-in stroke font are stroked paths with their own style
+                    self._write_items( item.stroke_paths(), layer, flip, item_clips )
 
                 fill, stroke, stroke_width = self._get_fill_stroke( item )
                 if layer == "Edge.Cuts":
@@ -306,58 +401,103 @@ class Svg2ModExport(ABC):
                 fill = (True if re.match("^Keepout", str(layer)) else fill)
                 stroke_width = (0.508 if re.match("^Keepout", str(layer)) else stroke_width)
 
+                flattened = item.segments( precision = self.precision )
+                if isinstance( item, svg.Text ) and not flattened:
+                    continue
+                if item_clips:
+                    flattened = self._clip_segments( flattened, item_clips, fill )
+
+                segments = [
+                    PolygonSegment( segment )
+                    for segment in flattened if segment
+                ]
+
                 for segment in segments:
                     segment.process( self, flip, fill )
 
-                if len( segments ) > 1:
-                    # Sort segments in order of size
-                    segments.sort(key=lambda v: svg.Segment(v.bbox[0], v.bbox[1]).length(), reverse=True)
-
-                    # Write all segments
-                    while len(segments) > 0:
-                        inlinable = [segments[0]]
-
-                        # Search to see if any paths are contained in the current shape
-                        for seg in segments[1:]:
-                            # Contained in parent shape
-                            if fill and not inlinable[0].are_distinct(seg):
-                                append = True
-                                if len(inlinable) > 1:
-                                    for hole in inlinable[1:]:
-                                        # Contained in a hole. It is separate
-                                        if not hole.are_distinct(seg):
-                                            append = False
-                                            break
-                                if append: inlinable.append(seg)
-                        for poly in inlinable:
-                            segments.pop(segments.index(poly))
-                        if len(inlinable) > 1:
-                            points = inlinable[ 0 ].inline( inlinable[ 1 : ] )
-                        elif len(inlinable) > 0:
-                            points = inlinable[ 0 ].points
-
-                        logger.debug( "  Writing {} with {} points".format(item.__class__.__name__, len( points ) ))
-
-                        self._write_polygon(
-                            points, layer, fill, stroke, stroke_width
-                        )
+                if fill and self.merge_fills:
+                    # Filled shapes with the same layer and stroke are merged and written together
+                    key = ( layer, stroke, stroke_width )
+                    if key not in self._fills:
+                        self._fills[ key ] = ( PolygonUnion( self.resolution ), [] )
+                    self._fills[ key ][ 0 ].add( segments, item.style.get( "fill-rule" ) )
+                    self._fills[ key ][ 1 ].append( item.id )
                     continue
 
-                if len( segments ) > 0:
-                    points = segments[ 0 ].points
+                if fill:
+                    # Sort the segments into outlines and their holes
+                    tree = PolygonSegment.nest( segments )
+                    # Under nonzero a hole wound the same way as its outline is filled
+                    if item.style.get( "fill-rule" ) != "evenodd" and any(
+                        ( signed_area( hole.points ) > 0 ) == ( signed_area( outline.points ) > 0 )
+                        for outline, holes in tree for hole in holes
+                    ):
+                        logger.warning(
+                            "Unsupported fill-rule=nonzero for {} {}, use --merge-fills to follow it".format(
+                                item.__class__.__name__, item.id )
+                        )
+                else:
+                    tree = [ ( segment, [] ) for segment in sorted(
+                        segments, reverse = True,
+                        key = lambda v: svg.Segment( v.bbox[ 0 ], v.bbox[ 1 ] ).length()
+                    ) ]
+                self._write_tree(
+                    tree, item.__class__.__name__, layer, fill, stroke, stroke_width, [ item.id ],
+                    # The strokes of the stroke font are open lines
+                    closed = not isinstance( item, svg.StrokeGlyph )
+                )
 
-                if len ( segments ) == 1:
+            else:
+                logger.warning( "Unsupported SVG element: {}".format(item.__class__.__name__))
 
-                    logger.debug( "  Writing {} with {} points".format(item.__class__.__name__, len( points ) ))
 
-                    self._write_polygon(
-                        points, layer, fill, stroke, stroke_width
-                    )
-                else:
-                    logger.info( "  Skipping {} with 0 points".format(item.__class__.__name__))
+    #------------------------------------------------------------------------
+
+    def _write_fills( self ):
+        ''' Write the union of the filled shapes collected by _write_items '''
+
+        for ( layer, stroke, stroke_width ), ( union, ids ) in self._fills.items():
+            svg.ResourceLimits.check_time()
+            self._write_tree(
+                union.nest(), "{} filled shapes".format( union.shapes ),
+                layer, True, stroke, stroke_width, ids
+            )
+        self._fills = {}
+
+
+    #------------------------------------------------------------------------
+
+    def _write_tree( self, tree, name, layer, fill, stroke, stroke_width, ids = (), closed = True ):
+        ''' Write a list of (outline, holes). ids are the svg ids of the
+        elements it came from, reported if validating finds a crossing.
+        Stroked outlines that are not closed are written as lines.
+        '''
+
+        if len( tree ) < 1:
+            logger.info( "  Skipping {} with 0 points".format( name ))
 
+        for outline, holes in tree:
+
+            if len( holes ) > 0:
+                points = outline.inline( holes )
             else:
-                logger.warning( "Unsupported SVG element: {}".format(item.__class__.__name__))
+                points = outline.points
+
+            if fill:
+                points = PolygonSegment.drop_spikes( points, self.resolution / 2 )
+
+            logger.debug( "  Writing {} with {} points".format( name, len( points ) ))
+
+            if self.validate and fill:
+                crossing = PolygonSegment.find_crossing( points, self.resolution )
+                if crossing is not None:
+                    self.invalid.append( ( list( ids ), layer ) )
+                    logger.error( "Polygon from {} on {} crosses itself near ({}, {})".format(
+                        ", ".join( ids ), layer, crossing.x, crossing.y ) )
+
+            self._write_polygon(
+                points, layer, fill, stroke, stroke_width, closed
+            )
 
 
     #------------------------------------------------------------------------
@@ -396,14 +536,16 @@ class Svg2ModExport(ABC):
 
                 layer = self._get_layer_name( i_name, name, front )
 
-                self._write_items( group.items, layer, not front )
+                clips = ( group.clip_path, ) if group.clip_path is not None else ()
+                self._write_items( group.items, layer, not front, clips )
+                self._write_fills()
 
         self._write_module_footer( front )
 
 
     #------------------------------------------------------------------------
 
-    def _write_polygon( self, points, layer, fill, stroke, stroke_width ):
+    def _write_polygon( self, points, layer, fill, stroke, stroke_width, closed = True ):
 
         if fill and len(points) > 2:
             self._write_polygon_filled(
@@ -416,9 +558,14 @@ class Svg2ModExport(ABC):
             if len(points) == 1:
                 points.append(copy.copy(points[0]))
 
-            self._write_polygon_outline(
-                points, layer, stroke_width
-            )
+            if closed:
+                self._write_polygon_outline(
+                    points, layer, stroke_width
+                )
+            else:
+                self._write_polyline(
+                    points, layer, stroke_width
+                )
             return
 
         if len(points) < 3:
@@ -444,6 +591,13 @@ class Svg2ModExport(ABC):
 
     def _write_polygon_outline( self, points, layer, stroke_width ):
 
+        self._write_polyline( points, layer, stroke_width )
+
+
+    #------------------------------------------------------------------------
+
+    def _write_polyline( self, points, layer, stroke_width ):
+
         prior_point = None
         for point in points:
 
@@ -463,22 +617,44 @@ class Svg2ModExport(ABC):
         classes scale factor.
         '''
 
-        transformed_point = svg.Point(
-            ( point.x + self.translation.x ) * self.scale_factor,
-            ( point.y + self.translation.y ) * self.scale_factor,
-        )
+        return self.transform_points( [ point ], flip )[ 0 ]
+
 
-        if flip:
-            transformed_point.x *= -1
+    #------------------------------------------------------------------------
+
+    def transform_points( self, points, flip = False ):
+        ''' Transform all of the points at once. The translation, scale
+        and mirroring are a single multiply and add for each coordinate
+        and points are snapped to the output resolution as they are made.
+        '''
+
+        scale_y = self.scale_factor
+        scale_x = -scale_y if flip else scale_y
+        offset_x = self.translation.x
+        offset_y = self.translation.y
 
         if self.use_mm:
-            transformed_point.x = transformed_point.x
-            transformed_point.y = transformed_point.y
-        else:
-            transformed_point.x = int( round( transformed_point.x ) )
-            transformed_point.y = int( round( transformed_point.y ) )
+            # Dividing by the integer steps gives the shortest decimal
+            steps = int( round( 1 / self.resolution ) )
+            return [
+                svg.Point(
+                    round( ( point.x + offset_x ) * scale_x * steps ) / steps,
+                    round( ( point.y + offset_y ) * scale_y * steps ) / steps,
+                )
+                for point in points
+            ]
 
-        return transformed_point
+        def rounded( x, y ):
+            # Point() would turn these back into floats
+            point = svg.Point( 0, 0 )
+            point.x = int( round( x ) )
+            point.y = int( round( y ) )
+            return point
+
+        return [
+            rounded( ( point.x + offset_x ) * scale_x, ( point.y + offset_y ) * scale_y )
+            for point in points
+        ]
 
 
     #------------------------------------------------------------------------
@@ -496,6 +672,8 @@ class Svg2ModExport(ABC):
         writer is closed.
         '''
 
+        svg.ResourceLimits.start_stage( "write" )
+
         self._prune()
 
         # Must come after pruning:
@@ -558,6 +736,8 @@ class Svg2ModExportLegacy( Svg2ModExport ):
         precision = 20.0,
         use_mm = True,
         dpi = DEFAULT_DPI,
+        validate = False,
+        merge_fills = False,
     ):
         super( Svg2ModExportLegacy, self ).__init__(
             svg2mod_import,
@@ -568,6 +748,8 @@ class Svg2ModExportLegacy( Svg2ModExport ):
             use_mm,
             dpi,
             pads = False,
+            validate = validate,
+            merge_fills = merge_fills,
         )
 
         self.include_reverse = True
@@ -741,6 +923,8 @@ class Svg2ModExportLegacyUpdater( Svg2ModExportLegacy ):
         precision = 20.0,
         dpi = DEFAULT_DPI,
         include_reverse = True,
+        validate = False,
+        merge_fills = False,
     ):
         self.file_name = file_name
         use_mm = self._parse_output_file()
@@ -753,6 +937,8 @@ class Svg2ModExportLegacyUpdater( Svg2ModExportLegacy ):
             precision,
             use_mm,
             dpi,
+            validate,
+            merge_fills,
         )
 
 
@@ -1317,9 +1503,13 @@ class Svg2ModExportPretty( Svg2ModExport ):
 
     def _write_thru_hole( self, circle, layer ):
 
+        radius = circle.rx
         if not isinstance(circle, svg.Circle):
             logger.info("Found an ellipse in Drill layer. Using an average of rx and ry.")
-            circle.rx = (circle.rx + circle.ry ) / 2
+            radius = (circle.rx + circle.ry ) / 2
+
+        # The circle geometry is stored untransformed
+        matrix = circle.current_matrix()
 
         l_name = layer
         options = {}
@@ -1333,7 +1523,7 @@ class Svg2ModExportPretty( Svg2ModExport ):
         if plated and options.get("copper_pad") and not isinstance(options["copper_pad"], bool):
             pad_number = str(options.get("copper_pad"))
 
-        rad = circle.rx * self.scale_factor
+        rad = radius * matrix.mean_scale() * self.scale_factor
         drill = rad * 2
 
         size = circle.style.get("stroke-width") * self.scale_factor
@@ -1346,7 +1536,7 @@ class Svg2ModExportPretty( Svg2ModExport ):
         else:
             size = rad
 
-        center = self.transform_point(circle.center)
+        center = self.transform_point(matrix * circle.center)
 
         self.output_file.write(
             '\n  (pad "{0}" {1}thru_hole circle (at {2} {3}) (size {4} {4}) (drill {5}) (layers *.Mask{6}) {7})'.format(
@@ -1432,6 +1622,79 @@ class Svg2ModExportLatest(Svg2ModExportPretty):
         self._extra_indent = 0
 
 
+    #------------------------------------------------------------------------
+
+    def _write_text( self, text, layer, flip ):
+        '''Write each run of the text as a fp_text with the font face,
+        which needs kicad >= 7. Runs in the built-in stroke font use
+        kicad's stroke font. Text that is skewed, mirrored or scaled
+        differently along x and y can't be represented and is written
+        as outlines instead.
+        The runs are anchored where Text.convert_to_path places the
+        outlines so switching between the two does not move the text.
+        '''
+        l_name = layer.split( ":", 1 )[ 0 ]
+        if l_name == "Keepout" or not text.text:
+            return False
+
+        a, b, c, d, _, _ = text.current_matrix().vect
+        scale = math.sqrt( abs( a * d - b * c ) )
+        if scale == 0 or abs( a - d ) > 1e-6 * scale or abs( b + c ) > 1e-6 * scale:
+            return False
+
+        angle = math.degrees( math.atan2( b, a ) )
+        angle = angle if flip else -angle
+        angle = round( angle, 4 ) % 360
+
+        prev_origin = text.text[ 0 ][ 1 ].origin
+        x = prev_origin.x
+        for string, attrib in text.text:
+
+            if prev_origin != attrib.origin:
+                prev_origin = attrib.origin
+                x = attrib.origin.x
+
+            if attrib.font_file is None:
+                continue
+
+            font = svg.FontCache.get( attrib.font_file )
+            position = self.transform_point(
+                text.current_matrix() * svg.Point( x, attrib.origin.y + attrib.size ), flip
+            )
+            x += font.advance( string ) * attrib.size / font.units_per_em
+
+            if not string.strip():
+                continue
+
+            size = attrib.size * scale * self.scale_factor
+            # The built-in stroke font is drawn with kicad's own stroke font
+            face = ""
+            if not isinstance( font, svg.StrokeFont ):
+                face = "(face {}) ".format( json.dumps( font.family or attrib.font_family, ensure_ascii = False ) )
+
+            style = ""
+            if attrib.bold is not None and attrib.bold.lower() != "normal": style += " bold"
+            if attrib.italic is not None and attrib.italic.lower() != "normal": style += " italic"
+
+            self.output_file.write(
+                """\n  (fp_text user {0} (at {1} {2}{3}) (layer {4})
+    (effects (font {5}(size {6} {6}) (thickness {7}){8}) (justify left bottom{9}))
+  )""".format(
+                    json.dumps( string, ensure_ascii = False ), #0
+                    position.x, #1
+                    position.y, #2
+                    " {}".format( angle ) if angle else "", #3
+                    l_name, #4
+                    face, #5
+                    size, #6
+                    size * 0.15, #7
+                    style, #8
+                    " mirror" if flip else "", #9
+                )
+            )
+
+        return True
+
 
     #------------------------------------------------------------------------
 
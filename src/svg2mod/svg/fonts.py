@@ -0,0 +1,610 @@
+# Copyright (C) 2022 -- svg2mod developers < GitHub.com / svg2mod >
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+'''
+Discovery of the fonts installed on the system.
+
+The family and style names of every font file are kept in an index
+file in the user cache directory so they only have to be read again
+when a font directory or font file changes.
+
+Faces of a font collection (.ttc) other than the first are referred
+to as "<file>#<face number>", split_font_file() separates the two.
+'''
+
+import atexit
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import itertools
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import platform
+import re
+import struct
+import subprocess
+import threading
+from typing import Dict, List, Tuple
+
+from fontTools.pens.basePen import BasePen
+from fontTools.ttLib import ttFont
+from svg2mod.coloredlogger import logger
+
+from . import strokefont
+from .geometry import Bezier, MoveTo, Point, Segment
+
+# The first four bytes of the font formats fontTools can read
+_font_signatures = (b"\x00\x01\x00\x00", b"OTTO", b"true", b"typ1", b"ttcf", b"wOFF", b"wOF2")
+
+#----------------------------------------------------------------------------
+
+def split_font_file(font_file:str) -> Tuple[str, int]:
+    '''Split a font file reference into the file path and face number'''
+    path, sep, number = font_file.rpartition("#")
+    if sep and number.isdigit():
+        return path, int(number)
+    return font_file, 0
+
+#----------------------------------------------------------------------------
+
+class GlyphPen(BasePen):
+    '''Pen drawing a glyph outline directly into the
+    path instructions (MoveTo, Segment, Bezier) used by Path.items.
+    Coordinates are kept in font units.
+    '''
+
+    def __init__(self, glyph_set):
+        BasePen.__init__(self, glyph_set)
+        self.items = []
+        self._start = None
+        self._current = None
+
+    def _moveTo(self, pt):
+        self._start = self._current = Point(pt)
+        self.items.append(MoveTo(self._current))
+
+    def _lineTo(self, pt):
+        pt = Point(pt)
+        self.items.append(Segment(self._current, pt))
+        self._current = pt
+
+    def _curveToOne(self, pt1, pt2, pt3):
+        pt3 = Point(pt3)
+        self.items.append(Bezier([self._current, Point(pt1), Point(pt2), pt3]))
+        self._current = pt3
+
+    def _qCurveToOne(self, pt1, pt2):
+        pt2 = Point(pt2)
+        self.items.append(Bezier([self._current, Point(pt1), pt2]))
+        self._current = pt2
+
+    def _closePath(self):
+        self.items.append(Segment(self._current, self._start))
+        self._current = self._start
+
+#----------------------------------------------------------------------------
+
+class LoadedFont:
+    '''An opened font with the tables needed to draw text.
+    The font file is memory mapped so the pages are shared by every
+    process using the same font and only the parts that are used are read.
+    '''
+
+    def __init__(self, font_file:str):
+        path, number = split_font_file(font_file)
+        with open(path, "rb") as font:
+            self._map = mmap.mmap(font.fileno(), 0, access=mmap.ACCESS_READ)
+        self.number = number
+        if number == 0 and self._map[:4] != b"ttcf":
+            number = -1
+        self.ttf = ttFont.TTFont(self._map, fontNumber=number, lazy=True)
+        self.glyph_set = self.ttf.getGlyphSet()
+        self.cmap = self.ttf.getBestCmap() or {}
+        self.units_per_em = self.ttf["head"].unitsPerEm
+        self._outlines = {}
+
+    @property
+    def family(self) -> str:
+        '''Family name of the font'''
+        return _get_name(self.ttf["name"], 1)
+
+    def advance(self, text:str) -> float:
+        '''Total advance width of text in font units'''
+        width = 0
+        for char in text:
+            name = self.glyph_name(char)
+            if name is not None:
+                width += self.glyph_set[name].width
+        return width
+
+    @functools.cached_property
+    def digest(self) -> str:
+        '''Hash of the font file contents and the face number,
+        since every face of a collection is in the same file.
+        '''
+        digest = hashlib.sha1(self._map).hexdigest()
+        if self.number:
+            digest += f"-{self.number}"
+        return digest
+
+    def glyph_name(self, char:str) -> str:
+        '''Return the glyph name of char or None if the font does not have it'''
+        name = self.cmap.get(ord(char))
+        if name is None or name not in self.glyph_set:
+            return None
+        return name
+
+    def outline(self, name:str) -> Tuple[tuple, float]:
+        '''Return the path instructions of the glyph in font units
+        and its advance width. Outlines are drawn once per glyph
+        and shared by every use of the glyph, so they must not be modified.
+        '''
+        outline = self._outlines.get(name)
+        if outline is None:
+            glyph = self.glyph_set[name]
+            pen = GlyphPen(self.glyph_set)
+            glyph.draw(pen)
+            outline = (tuple(pen.items), glyph.width)
+            self._outlines[name] = outline
+        return outline
+
+    def close(self):
+        '''Close the font and release the memory map'''
+        self.ttf.close()
+        self._map.close()
+
+#----------------------------------------------------------------------------
+
+class StrokeFont:
+    '''The built-in stroke font with the same interface as LoadedFont.
+    Its outlines are open polylines which have to be stroked.
+    '''
+
+    units_per_em = strokefont.UNITS_PER_EM
+    family = strokefont.FAMILY
+
+    def __init__(self):
+        self._outlines = {}
+
+    def glyph_name(self, char:str) -> str:
+        '''Return the glyph name of char or None if the font does not have it'''
+        return char if char in strokefont.GLYPHS else None
+
+    def outline(self, name:str) -> Tuple[tuple, float]:
+        '''Return the path instructions of the glyph in font units
+        and its advance width. They must not be modified.
+        '''
+        outline = self._outlines.get(name)
+        if outline is None:
+            items = []
+            for stroke in strokefont.GLYPHS[name]:
+                points = [Point(stroke[i], stroke[i+1]) for i in range(0, len(stroke), 2)]
+                items.append(MoveTo(points[0]))
+                items.extend(Segment(start, end) for start, end in zip(points, points[1:]))
+            outline = (tuple(items), strokefont.ADVANCE)
+            self._outlines[name] = outline
+        return outline
+
+    def advance(self, text:str) -> float:
+        '''Total advance width of text in font units'''
+        return strokefont.ADVANCE * sum(1 for char in text if char in strokefont.GLYPHS)
+
+STROKE_FONT = StrokeFont()
+
+#----------------------------------------------------------------------------
+
+class FontCache:
+    '''Least recently used cache of opened fonts shared by all text elements.
+    Fonts are checked against the mtime of their file so a font that
+    is replaced on disk is opened again.
+    '''
+
+    max_size = 16
+    _fonts = collections.OrderedDict()
+
+    @classmethod
+    def get(cls, font_file:str) -> LoadedFont:
+        '''Return the opened font, opening it if it is not cached'''
+        if font_file == strokefont.FONT_FILE:
+            return STROKE_FONT
+        key = (font_file, os.stat(split_font_file(font_file)[0]).st_mtime)
+        font = cls._fonts.get(key)
+        if font is not None:
+            cls._fonts.move_to_end(key)
+            return font
+
+        font = LoadedFont(font_file)
+        cls._fonts[key] = font
+        while len(cls._fonts) > max(cls.max_size, 1):
+            cls._fonts.popitem(last=False)[1].close()
+        return font
+
+    @classmethod
+    def clear(cls):
+        '''Close and forget all cached fonts'''
+        while cls._fonts:
+            cls._fonts.popitem()[1].close()
+
+#----------------------------------------------------------------------------
+
+class FlatGlyphCache:
+    '''Cache of glyph outlines flattened into polylines in font units.
+
+    The tolerance of the flattening is relative to the em size and
+    rounded down to one of a few steps per power of two, so text
+    of any size converted with similar precisions shares entries.
+    The polylines are saved in the user cache directory, one file per
+    font keyed by a hash of the font file, when the process exits.
+
+    Setting FlatGlyphCache.cache_dir changes where the files are stored
+    and setting it to False keeps the cache in memory only.
+    '''
+
+    version = 1
+    cache_dir = None
+    steps_per_octave = 4
+    _fonts = {}
+    _dirty = set()
+
+    @classmethod
+    def tolerance(cls, precision:float, units_per_em:float) -> float:
+        '''Return the relative tolerance to flatten with to be at least
+        as fine as precision font units.
+        '''
+        if precision <= 0:
+            return 0
+        steps = math.floor(cls.steps_per_octave * math.log2(precision / units_per_em))
+        return 2 ** (steps / cls.steps_per_octave)
+
+    @classmethod
+    def get(cls, font:LoadedFont, name:str, tolerance:float) -> List[List[float]]:
+        '''Return the flattened rings of the glyph as lists of
+        x, y coordinates (x0, y0, x1, y1, ...) in font units.
+        '''
+        glyphs = cls._load(font.digest)
+        key = f"{tolerance!r}/{name}"
+        rings = glyphs.get(key)
+        if rings is None:
+            rings = cls.flatten(font.outline(name)[0], tolerance * font.units_per_em)
+            glyphs[key] = rings
+            cls._dirty.add(font.digest)
+        return rings
+
+    @staticmethod
+    def flatten(items:tuple, precision:float) -> List[List[float]]:
+        '''Flatten path instructions into rings of coordinates'''
+        rings = []
+        for move_to, group in itertools.groupby(items, lambda x: isinstance(x, MoveTo)):
+            if not move_to:
+                ring = []
+                for item in group:
+                    for pt in item.segments(precision):
+                        ring.extend((round(pt.x, 3), round(pt.y, 3)))
+                rings.append(ring)
+        return rings
+
+    @classmethod
+    def _path(cls, digest:str) -> str:
+        if cls.cache_dir is False:
+            return None
+        return os.path.join(cls.cache_dir or user_cache_dir(), "glyphs", f"{digest}.json")
+
+    @classmethod
+    def _load(cls, digest:str) -> dict:
+        glyphs = cls._fonts.get(digest)
+        if glyphs is None:
+            glyphs = {}
+            path = cls._path(digest)
+            if path is not None:
+                try:
+                    with open(path, "r", encoding="utf-8") as cache_file:
+                        data = json.load(cache_file)
+                    if data.get("version") == cls.version:
+                        glyphs = data["glyphs"]
+                except (OSError, ValueError, KeyError, AttributeError):
+                    pass
+            cls._fonts[digest] = glyphs
+        return glyphs
+
+    @classmethod
+    def save(cls):
+        '''Write the glyphs flattened since the last save to disk'''
+        while cls._dirty:
+            digest = cls._dirty.pop()
+            path = cls._path(digest)
+            if path is None:
+                continue
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as cache_file:
+                    json.dump({"version": cls.version, "glyphs": cls._fonts[digest]}, cache_file)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.debug(f"Unable to save glyph cache to {path}: {e}")
+
+atexit.register(FlatGlyphCache.save)
+
+#----------------------------------------------------------------------------
+
+def read_faces(font_file:str) -> List[List]:
+    '''Return a list of [family, style, face number] for every face
+    in the font file. Only the name table of each face is read.
+    '''
+    try:
+        with open(font_file, "rb") as font:
+            header = font.read(12)
+    except OSError:
+        return []
+    if header[:4] not in _font_signatures:
+        return []
+
+    count = struct.unpack(">I", header[8:12])[0] if header[:4] == b"ttcf" else 0
+    faces = []
+    for number in range(max(count, 1)):
+        try:
+            font = ttFont.TTFont(font_file, fontNumber=number if count else -1, lazy=True)
+        except Exception:
+            continue
+        try:
+            name = _get_name(font["name"], 1)
+            style = _get_name(font["name"], 2)
+        except Exception:
+            continue
+        finally:
+            font.close()
+        if name and style:
+            faces.append([name, style, number])
+    return faces
+
+#----------------------------------------------------------------------------
+
+def _get_name(table, name_id:int) -> str:
+    # Prefer the Macintosh names which were used historically then
+    # fall back to the English Windows names modern fonts may only have
+    for platform_id, encoding_id, lang_id in ((1,0,None), (3,1,0x409)):
+        record = table.getName(name_id, platform_id, encoding_id, lang_id)
+        if record is not None:
+            return record.toStr()
+    return None
+
+#----------------------------------------------------------------------------
+
+def fontconfig_fonts(timeout:float=10) -> Dict[str, Dict[str, str]]:
+    '''Return the fonts known to fontconfig in the same form as
+    FontIndex.load() by running fc-list, which answers from the
+    fontconfig cache instead of opening the fonts.
+    Returns None if fontconfig is not available.
+    '''
+    try:
+        result = subprocess.run(
+            ["fc-list", "--format", "%{file}\t%{index}\t%{fontformat}\t%{family}\t%{style}\n"],
+            capture_output=True, check=True, timeout=timeout,
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.debug(f"Unable to list fonts with fontconfig: {e}")
+        return None
+
+    fonts = {}
+    for line in result.stdout.decode("utf-8", "replace").splitlines():
+        fields = line.split("\t")
+        if len(fields) != 5:
+            continue
+        font_file, index, font_format, families, styles = fields
+        # Skip the named instances of variable fonts and formats fontTools cannot draw
+        if not index.isdigit() or int(index) >> 16 or font_format not in ("TrueType", "CFF"):
+            continue
+        number = int(index)
+        # fontconfig lists the typographic and the legacy names separated by commas,
+        # each family goes with the style at the same position
+        families = [name.replace("\\,", ",") for name in re.split(r"(?<!\\),", families)]
+        styles = [name.replace("\\,", ",") for name in re.split(r"(?<!\\),", styles)]
+        for name, style in zip(families, styles):
+            font_styles = fonts.setdefault(name, {})
+            if font_styles.get(style) is None:
+                font_styles[style] = f"{font_file}#{number}" if number else font_file
+    return fonts
+
+#----------------------------------------------------------------------------
+
+def user_cache_dir() -> str:
+    '''Return the platform specific cache directory for svg2mod'''
+    system = platform.system()
+    if system == "Windows":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~/AppData/Local")
+        return os.path.join(base, "svg2mod", "Cache")
+    if system == "Darwin":
+        return os.path.expanduser("~/Library/Caches/svg2mod")
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "svg2mod")
+
+#----------------------------------------------------------------------------
+
+class FontIndex:
+    '''Persistent index of the fonts found in a list of directories.
+
+    The index file remembers the mtime and listing of every directory
+    and the mtime, size and names of every font file. When the index is
+    loaded again only directories whose mtime changed are listed and
+    only files whose mtime or size changed are opened.
+
+    Setting FontIndex.cache_dir changes where the index is stored and
+    setting it to False disables the on disk index.
+    '''
+
+    version = 2
+    file_name = "font-index.json"
+    cache_dir = None
+
+    # Below this many files to read the process pool costs more than it saves
+    parallel_threshold = 32
+
+    def __init__(self, roots:List[str]):
+        self.roots = [os.path.expanduser(root) for root in roots]
+        self.dirs = {}
+        self.files = {}
+        self.changed = False
+
+    @classmethod
+    def index_path(cls) -> str:
+        '''Return the path of the index file or None if it is disabled'''
+        if cls.cache_dir is False:
+            return None
+        return os.path.join(cls.cache_dir or user_cache_dir(), cls.file_name)
+
+    def load(self, reload:bool=False) -> Dict[str, Dict[str, str]]:
+        '''Return a dictionary of font family names each holding
+        a dictionary of style names to font files.
+        If reload is True the saved index is ignored and every
+        font file is read again.
+        '''
+        cached_dirs, cached_files = ({}, {}) if reload else self._read()
+
+        font_files = self._walk(cached_dirs)
+        stale = [font_file for font_file in font_files if self._scan_file(font_file, cached_files)]
+        for font_file, faces in zip(stale, self._read_all(stale)):
+            self.files[font_file]["faces"] = faces
+
+        if self.changed or len(cached_files) != len(self.files) or len(cached_dirs) != len(self.dirs):
+            self._write()
+
+        fonts = {}
+        for font_file in font_files:
+            entry = self.files.get(font_file)
+            if entry is None:
+                continue
+            for name, style, number in entry["faces"]:
+                styles = fonts.setdefault(name, {})
+                if styles.get(style) is None:
+                    styles[style] = f"{font_file}#{number}" if number else font_file
+        return fonts
+
+    def _walk(self, cached_dirs:dict) -> List[str]:
+        '''Return every file in the font directories'''
+        font_files = []
+        # Symbolic links can lead back to a directory that was already scanned
+        visited = set()
+        for root in self.roots:
+            stack = [root]
+            while stack:
+                directory = stack.pop()
+                entry = self._scan_dir(directory, cached_dirs, visited)
+                if entry is None:
+                    continue
+                font_files.extend(os.path.join(directory, name) for name in entry["files"])
+                stack.extend(os.path.join(directory, name) for name in reversed(entry["subdirs"]))
+        return font_files
+
+    def _scan_dir(self, directory:str, cached_dirs:dict, visited:set) -> dict:
+        try:
+            stat = os.stat(directory)
+        except OSError:
+            return None
+        if (stat.st_dev, stat.st_ino) in visited:
+            return None
+        visited.add((stat.st_dev, stat.st_ino))
+        mtime = stat.st_mtime
+        entry = cached_dirs.get(directory)
+        if entry is None or entry["mtime"] != mtime:
+            files, subdirs = [], []
+            try:
+                with os.scandir(directory) as listing:
+                    for item in listing:
+                        if item.is_dir():
+                            subdirs.append(item.name)
+                        elif item.is_file():
+                            files.append(item.name)
+            except OSError:
+                return None
+            entry = {"mtime": mtime, "files": sorted(files), "subdirs": sorted(subdirs)}
+            self.changed = True
+        self.dirs[directory] = entry
+        return entry
+
+    def _scan_file(self, font_file:str, cached_files:dict) -> bool:
+        '''Record the cached entry of the file and return True
+        if the faces of the file need to be read again.
+        '''
+        try:
+            stat = os.stat(font_file)
+        except OSError:
+            return False
+        entry = cached_files.get(font_file)
+        if entry is None or entry["mtime"] != stat.st_mtime or entry["size"] != stat.st_size:
+            # Unreadable files are kept with no faces so they are not retried
+            self.files[font_file] = {"mtime": stat.st_mtime, "size": stat.st_size, "faces": []}
+            self.changed = True
+            return True
+        self.files[font_file] = entry
+        return False
+
+    def _read_all(self, font_files:List[str]) -> List[List]:
+        '''Read the faces of all the files, in parallel if there are many.
+        Forking a process with other threads running can deadlock it,
+        so the workers are spawned when this runs from a background
+        thread such as the one started by Text.start_font_discovery().
+        '''
+        if len(font_files) >= self.parallel_threshold and (os.cpu_count() or 1) > 1:
+            context = None
+            if threading.current_thread() is not threading.main_thread():
+                context = multiprocessing.get_context("spawn")
+            try:
+                with concurrent.futures.ProcessPoolExecutor(mp_context=context) as pool:
+                    chunk = max(1, len(font_files) // (4 * os.cpu_count()))
+                    return list(pool.map(read_faces, font_files, chunksize=chunk))
+            except (OSError, RuntimeError, concurrent.futures.process.BrokenProcessPool) as e:
+                logger.debug(f"Unable to read fonts in parallel: {e}")
+        return [read_faces(font_file) for font_file in font_files]
+
+    def _read(self) -> tuple:
+        path = self.index_path()
+        if path is None:
+            return {}, {}
+        try:
+            with open(path, "r", encoding="utf-8") as index_file:
+                data = json.load(index_file)
+            if data.get("version") != self.version or data.get("roots") != self.roots:
+                return {}, {}
+            return data["dirs"], data["files"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            return {}, {}
+
+    def _write(self):
+        path = self.index_path()
+        if path is None:
+            return
+        data = {
+            "version": self.version,
+            "roots": self.roots,
+            "dirs": self.dirs,
+            "files": self.files,
+        }
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so a concurrent run
+            # never reads a partially written index
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as index_file:
+                json.dump(data, index_file)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.debug(f"Unable to save font index to {path}: {e}")
+
+#----------------------------------------------------------------------------
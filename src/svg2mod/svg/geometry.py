@@ -340,3 +340,127 @@ def simplify_segment(segment, epsilon):
         # Remove redundant 'middle' Point
         return r1[:-1] + r2
     return [segment[0], segment[-1]]
+
+
+def signed_area(points):
+    '''Signed area of a closed ring of points (shoelace formula).
+    The sign depends on the winding direction of the ring.
+    '''
+    area = 0.0
+    for p, q in zip(points, points[1:] + points[:1]):
+        area += p.x * q.y - q.x * p.y
+    return area / 2
+
+
+def open_ring(points):
+    '''Return the points of a ring without the closing duplicate point'''
+    if len(points) > 1 and points[0] == points[-1]:
+        return points[:-1]
+    return points[:]
+
+
+def is_convex(points):
+    '''Check if a ring of points is a convex polygon'''
+    ring = open_ring(points)
+    if len(ring) < 3:
+        return False
+    sign = 0
+    for a, b, c in zip(ring, ring[1:] + ring[:1], ring[2:] + ring[:2]):
+        cross = (b.x - a.x) * (c.y - b.y) - (b.y - a.y) * (c.x - b.x)
+        if cross == 0:
+            continue
+        if sign == 0:
+            sign = 1 if cross > 0 else -1
+        elif (cross > 0) != (sign > 0):
+            return False
+    return sign != 0
+
+
+def _clip_edges(clip):
+    '''Yield the edges of a convex clip ring with a factor that makes
+    the cross product positive for points inside the ring.
+    '''
+    ring = open_ring(clip)
+    orientation = 1 if signed_area(ring) > 0 else -1
+    for a, b in zip(ring, ring[1:] + ring[:1]):
+        yield a, b, orientation
+
+
+def clip_polygon(points, clip):
+    '''Clip a closed polygon against a convex clip ring
+    using the Sutherland-Hodgman algorithm.
+    The returned ring is open (the first point is not repeated).
+    '''
+    output = open_ring(points)
+    for a, b, orientation in _clip_edges(clip):
+        if not output:
+            break
+        ring, output = output, []
+        prev = ring[-1]
+        prev_dist = orientation * ((b.x - a.x) * (prev.y - a.y) - (b.y - a.y) * (prev.x - a.x))
+        for cur in ring:
+            cur_dist = orientation * ((b.x - a.x) * (cur.y - a.y) - (b.y - a.y) * (cur.x - a.x))
+            if (cur_dist >= 0) != (prev_dist >= 0):
+                t = prev_dist / (prev_dist - cur_dist)
+                output.append(prev + t * (cur - prev))
+            if cur_dist >= 0:
+                output.append(cur)
+            prev, prev_dist = cur, cur_dist
+    return output
+
+
+def clip_polyline(points, clip):
+    '''Clip an open poly-line against a convex clip ring
+    using the Cyrus-Beck algorithm.
+    Returns a list of poly-lines that are inside the clip.
+    '''
+    edges = list(_clip_edges(clip))
+    if len(points) == 1:
+        inside = all(
+            o * ((b.x - a.x) * (points[0].y - a.y) - (b.y - a.y) * (points[0].x - a.x)) >= 0
+            for a, b, o in edges
+        )
+        return [points[:]] if inside else []
+
+    pieces = []
+    current = []
+    for p, q in zip(points, points[1:]):
+        d = q - p
+        t0, t1 = 0.0, 1.0
+        for a, b, orientation in edges:
+            dist = orientation * ((b.x - a.x) * (p.y - a.y) - (b.y - a.y) * (p.x - a.x))
+            rate = orientation * ((b.x - a.x) * d.y - (b.y - a.y) * d.x)
+            if rate == 0:
+                if dist < 0:
+                    t0, t1 = 1.0, 0.0
+                    break
+                continue
+            t = -dist / rate
+            if rate > 0:
+                t0 = max(t0, t)
+            else:
+                t1 = min(t1, t)
+            if t0 > t1:
+                break
+
+        if t0 > t1:
+            if len(current) > 1:
+                pieces.append(current)
+            current = []
+            continue
+
+        start = p if t0 == 0 else p + t0 * d
+        end = q if t1 == 1 else p + t1 * d
+        if current and t0 == 0:
+            current.append(end)
+        else:
+            if len(current) > 1:
+                pieces.append(current)
+            current = [start, end]
+        if t1 < 1:
+            pieces.append(current)
+            current = []
+
+    if len(current) > 1:
+        pieces.append(current)
+    return pieces
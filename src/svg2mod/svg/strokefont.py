@@ -0,0 +1,147 @@
+# Copyright (C) 2022 -- svg2mod developers < GitHub.com / svg2mod >
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+'''
+A small stroke font built into svg2mod so text can be converted
+without any installed fonts, similar to the stroke font of kicad.
+
+Every printable ASCII character is a list of polylines stored as
+flat x, y coordinate tuples (x0, y0, x1, y1, ...). Coordinates are
+in font units with y pointing up from the baseline, the cap height
+is 6, the x height is 4 and descenders reach -2.
+'''
+
+# Referenced as the font file of text using the stroke font
+FONT_FILE = "<svg2mod stroke font>"
+FAMILY = "svg2mod stroke"
+
+UNITS_PER_EM = 9
+ADVANCE = 6
+# Width of the strokes relative to the font size
+STROKE_WIDTH = 0.1
+
+GLYPHS = {
+    ' ': (),
+    '!': ((2, 6, 2, 2), (2, 0.5, 2, 0)),
+    '"': ((1.5, 6, 1.5, 4.5), (2.5, 6, 2.5, 4.5)),
+    '#': ((1.25, 0, 1.75, 6), (2.25, 0, 2.75, 6), (0, 2, 4, 2), (0, 4, 4, 4)),
+    '$': (
+        (4, 4.5, 3, 5.25, 1, 5.25, 0, 4.5, 0, 3.75, 1, 3,
+         3, 3, 4, 2.25, 4, 1.5, 3, 0.75, 1, 0.75, 0, 1.5),
+        (2, 6, 2, 0),
+    ),
+    '%': (
+        (0, 0, 4, 6),
+        (0.5, 6, 0, 5.5, 0.5, 5, 1, 5.5, 0.5, 6),
+        (3.5, 1, 3, 0.5, 3.5, 0, 4, 0.5, 3.5, 1),
+    ),
+    '&': (
+        (4, 0, 0.5, 4.5, 0.5, 5.5, 1, 6, 2, 6, 2.5, 5.5, 2.5, 4.5, 0, 2, 0, 1, 1, 0, 2.5, 0, 4, 2),
+    ),
+    "'": ((2, 6, 2, 4.5),),
+    '(': ((3, 6, 2, 4.5, 2, 1.5, 3, 0),),
+    ')': ((1, 6, 2, 4.5, 2, 1.5, 1, 0),),
+    '*': ((2, 5, 2, 1), (0.5, 4, 3.5, 2), (0.5, 2, 3.5, 4)),
+    '+': ((2, 5, 2, 1), (0, 3, 4, 3)),
+    ',': ((2, 0.5, 2, 0, 1.5, -1),),
+    '-': ((0.5, 3, 3.5, 3),),
+    '.': ((2, 0.5, 2, 0),),
+    '/': ((0, 0, 4, 6),),
+    '0': ((1, 0, 0, 1, 0, 5, 1, 6, 3, 6, 4, 5, 4, 1, 3, 0, 1, 0), (3.5, 5.5, 0.5, 0.5)),
+    '1': ((1, 5, 2, 6, 2, 0), (1, 0, 3, 0)),
+    '2': ((0, 5, 1, 6, 3, 6, 4, 5, 4, 4, 0, 0, 4, 0),),
+    '3': ((0, 5, 1, 6, 3, 6, 4, 5, 4, 4, 3, 3, 1.5, 3), (3, 3, 4, 2, 4, 1, 3, 0, 1, 0, 0, 1)),
+    '4': ((3, 0, 3, 6, 0, 2, 4, 2),),
+    '5': ((4, 6, 0, 6, 0, 3.5, 3, 3.5, 4, 2.5, 4, 1, 3, 0, 1, 0, 0, 1),),
+    '6': ((4, 5, 3, 6, 1, 6, 0, 5, 0, 1, 1, 0, 3, 0, 4, 1, 4, 2, 3, 3, 1, 3, 0, 2),),
+    '7': ((0, 6, 4, 6, 1, 0),),
+    '8': (
+        (1, 3, 0, 4, 0, 5, 1, 6, 3, 6, 4, 5, 4, 4, 3, 3,
+         1, 3, 0, 2, 0, 1, 1, 0, 3, 0, 4, 1, 4, 2, 3, 3),
+    ),
+    '9': ((0, 1, 1, 0, 3, 0, 4, 1, 4, 5, 3, 6, 1, 6, 0, 5, 0, 4, 1, 3, 3, 3, 4, 4),),
+    ':': ((2, 4, 2, 3.5), (2, 0.5, 2, 0)),
+    ';': ((2, 4, 2, 3.5), (2, 0.5, 2, 0, 1.5, -1)),
+    '<': ((4, 5, 0, 3, 4, 1),),
+    '=': ((0, 4, 4, 4), (0, 2, 4, 2)),
+    '>': ((0, 5, 4, 3, 0, 1),),
+    '?': ((0, 5, 1, 6, 3, 6, 4, 5, 4, 4, 2, 2.5, 2, 1.5), (2, 0.5, 2, 0)),
+    '@': (
+        (3, 2, 3, 4, 1.5, 4, 1, 3, 1, 2, 3, 2, 4, 3, 4, 5, 3, 6, 1, 6, 0, 5, 0, 1, 1, 0, 3.5, 0),
+    ),
+    'A': ((0, 0, 2, 6, 4, 0), (0.67, 2, 3.33, 2)),
+    'B': ((0, 0, 0, 6, 3, 6, 4, 5.25, 4, 3.75, 3, 3, 0, 3), (3, 3, 4, 2.25, 4, 0.75, 3, 0, 0, 0)),
+    'C': ((4, 5, 3, 6, 1, 6, 0, 5, 0, 1, 1, 0, 3, 0, 4, 1),),
+    'D': ((0, 0, 0, 6, 2.5, 6, 4, 4.5, 4, 1.5, 2.5, 0, 0, 0),),
+    'E': ((4, 6, 0, 6, 0, 0, 4, 0), (0, 3, 3, 3)),
+    'F': ((4, 6, 0, 6, 0, 0), (0, 3, 3, 3)),
+    'G': ((4, 5, 3, 6, 1, 6, 0, 5, 0, 1, 1, 0, 3, 0, 4, 1, 4, 3, 2, 3),),
+    'H': ((0, 0, 0, 6), (4, 0, 4, 6), (0, 3, 4, 3)),
+    'I': ((1, 6, 3, 6), (2, 6, 2, 0), (1, 0, 3, 0)),
+    'J': ((4, 6, 4, 1, 3, 0, 1, 0, 0, 1),),
+    'K': ((0, 0, 0, 6), (4, 6, 0, 2), (1.33, 3.33, 4, 0)),
+    'L': ((0, 6, 0, 0, 4, 0),),
+    'M': ((0, 0, 0, 6, 2, 3, 4, 6, 4, 0),),
+    'N': ((0, 0, 0, 6, 4, 0, 4, 6),),
+    'O': ((1, 0, 0, 1, 0, 5, 1, 6, 3, 6, 4, 5, 4, 1, 3, 0, 1, 0),),
+    'P': ((0, 0, 0, 6, 3, 6, 4, 5, 4, 4, 3, 3, 0, 3),),
+    'Q': ((1, 0, 0, 1, 0, 5, 1, 6, 3, 6, 4, 5, 4, 1, 3, 0, 1, 0), (2.5, 1.5, 4, 0)),
+    'R': ((0, 0, 0, 6, 3, 6, 4, 5, 4, 4, 3, 3, 0, 3), (2, 3, 4, 0)),
+    'S': ((4, 5, 3, 6, 1, 6, 0, 5, 0, 4, 1, 3, 3, 3, 4, 2, 4, 1, 3, 0, 1, 0, 0, 1),),
+    'T': ((0, 6, 4, 6), (2, 6, 2, 0)),
+    'U': ((0, 6, 0, 1, 1, 0, 3, 0, 4, 1, 4, 6),),
+    'V': ((0, 6, 2, 0, 4, 6),),
+    'W': ((0, 6, 1, 0, 2, 4, 3, 0, 4, 6),),
+    'X': ((0, 0, 4, 6), (0, 6, 4, 0)),
+    'Y': ((0, 6, 2, 3, 4, 6), (2, 3, 2, 0)),
+    'Z': ((0, 6, 4, 6, 0, 0, 4, 0),),
+    '[': ((3, 6, 1.5, 6, 1.5, 0, 3, 0),),
+    '\\': ((0, 6, 4, 0),),
+    ']': ((1, 6, 2.5, 6, 2.5, 0, 1, 0),),
+    '^': ((0.5, 4, 2, 6, 3.5, 4),),
+    '_': ((0, -1, 4, -1),),
+    '`': ((1.5, 6, 2.5, 5),),
+    'a': ((0.5, 4, 3, 4, 4, 3, 4, 0), (4, 2, 1, 2, 0, 1.5, 0, 0.5, 1, 0, 3, 0, 4, 1)),
+    'b': ((0, 6, 0, 0), (0, 3, 1, 4, 3, 4, 4, 3, 4, 1, 3, 0, 1, 0, 0, 1)),
+    'c': ((4, 3, 3, 4, 1, 4, 0, 3, 0, 1, 1, 0, 3, 0, 4, 1),),
+    'd': ((4, 6, 4, 0), (4, 3, 3, 4, 1, 4, 0, 3, 0, 1, 1, 0, 3, 0, 4, 1)),
+    'e': ((0, 2, 4, 2, 4, 3, 3, 4, 1, 4, 0, 3, 0, 1, 1, 0, 3, 0, 4, 0.5),),
+    'f': ((3.5, 6, 2.5, 6, 1.5, 5, 1.5, 0), (0, 4, 3, 4)),
+    'g': ((4, 4, 4, -1, 3, -2, 1, -2, 0, -1.5), (4, 3, 3, 4, 1, 4, 0, 3, 0, 1, 1, 0, 3, 0, 4, 1)),
+    'h': ((0, 6, 0, 0), (0, 3, 1, 4, 3, 4, 4, 3, 4, 0)),
+    'i': ((2, 4, 2, 0), (2, 5.5, 2, 5)),
+    'j': ((2.5, 4, 2.5, -1, 1.5, -2, 0.5, -2), (2.5, 5.5, 2.5, 5)),
+    'k': ((0, 6, 0, 0), (4, 4, 0, 1.5), (1.2, 2.25, 4, 0)),
+    'l': ((1, 6, 2, 6, 2, 1, 3, 0),),
+    'm': ((0, 4, 0, 0), (0, 3, 1, 4, 2, 3, 2, 0), (2, 3, 3, 4, 4, 3, 4, 0)),
+    'n': ((0, 4, 0, 0), (0, 3, 1, 4, 3, 4, 4, 3, 4, 0)),
+    'o': ((1, 0, 0, 1, 0, 3, 1, 4, 3, 4, 4, 3, 4, 1, 3, 0, 1, 0),),
+    'p': ((0, 4, 0, -2), (0, 3, 1, 4, 3, 4, 4, 3, 4, 1, 3, 0, 1, 0, 0, 1)),
+    'q': ((4, 4, 4, -2), (4, 3, 3, 4, 1, 4, 0, 3, 0, 1, 1, 0, 3, 0, 4, 1)),
+    'r': ((0, 4, 0, 0), (0, 2.5, 1.5, 4, 3, 4, 4, 3.5)),
+    's': ((4, 3.5, 3, 4, 1, 4, 0, 3.25, 1, 2, 3, 2, 4, 0.75, 3, 0, 1, 0, 0, 0.5),),
+    't': ((1.5, 6, 1.5, 1, 2.5, 0, 3.5, 0), (0, 4, 3, 4)),
+    'u': ((0, 4, 0, 1, 1, 0, 3, 0, 4, 1), (4, 4, 4, 0)),
+    'v': ((0, 4, 2, 0, 4, 4),),
+    'w': ((0, 4, 1, 0, 2, 3, 3, 0, 4, 4),),
+    'x': ((0, 0, 4, 4), (0, 4, 4, 0)),
+    'y': ((0, 4, 2, 0), (4, 4, 1, -2, 0, -2)),
+    'z': ((0, 4, 4, 4, 0, 0, 4, 0),),
+    '{': ((3, 6, 2, 5.5, 2, 3.5, 1, 3, 2, 2.5, 2, 0.5, 3, 0),),
+    '|': ((2, 6.5, 2, -1.5),),
+    '}': ((1, 6, 2, 5.5, 2, 3.5, 3, 3, 2, 2.5, 2, 0.5, 1, 0),),
+    '~': ((0, 3, 1, 3.5, 3, 2.5, 4, 3),),
+}
@@ -30,14 +30,16 @@ import os
 import platform
 import re
 import sys
+import threading
+import time
 import xml.etree.ElementTree as etree
-from typing import Iterable, List, Tuple
+from typing import List, Tuple
 
 from fontTools.misc import loggingTools
-from fontTools.pens.svgPathPen import SVGPathPen
-from fontTools.ttLib import ttFont
 from svg2mod.coloredlogger import logger
 
+from . import strokefont
+from .fonts import FlatGlyphCache, FontCache, FontIndex, StrokeFont, fontconfig_fonts
 from .geometry import Angle, Bezier, MoveTo, Point, Segment, simplify_segment
 
 svg_ns = '{http://www.w3.org/2000/svg}'
@@ -53,6 +55,7 @@ svg_defaults = {
         "stroke":"none",
         "stroke-width":"1px",
         "stroke-opacity":"1",
+        "fill-rule":None,
     }
 
 # Unit converter
@@ -74,13 +77,194 @@ unit_convert = {
 _font_warning_sent = False
 
 
+class ResourceLimitError(Exception):
+    '''Raised when a svg file exceeds one of the ResourceLimits'''
+
+
+class ResourceLimits:
+    '''Limits protecting a conversion from hostile or pathological svg files.
+    All limits are disabled (None) by default and are shared by the
+    whole process, in the same way as Text.default_font.
+
+    max_elements: number of svg elements created while parsing
+    max_path_commands: number of commands and numbers in all path data
+    max_vertices: number of points generated when flattening curves.
+        Curves are flattened more coarsely before this limit is hit.
+    max_stage_time: wall clock seconds for each stage (parse, write)
+
+    The counters are reset by start_stage(), which is called
+    by Svg.parse and Svg2ModExport.write.
+    '''
+
+    max_elements = None
+    max_path_commands = None
+    max_vertices = None
+    max_stage_time = None
+
+    stage = None
+    elements = 0
+    path_commands = 0
+    vertices = 0
+    _stage_start = None
+    _coarse_warning_sent = False
+
+    @classmethod
+    def start_stage(cls, stage:str):
+        '''Reset all counters and the timer for a new stage'''
+        cls.stage = stage
+        cls.elements = 0
+        cls.path_commands = 0
+        cls.vertices = 0
+        cls._stage_start = time.monotonic()
+        cls._coarse_warning_sent = False
+
+    @classmethod
+    def check_time(cls):
+        '''Raise ResourceLimitError if the current stage ran too long'''
+        if cls.max_stage_time is None or cls._stage_start is None:
+            return
+        elapsed = time.monotonic() - cls._stage_start
+        if elapsed > cls.max_stage_time:
+            raise ResourceLimitError("Time limit of {}s exceeded during {} stage".format(
+                cls.max_stage_time, cls.stage))
+
+    @classmethod
+    def add_element(cls):
+        '''Count a parsed element'''
+        cls.elements += 1
+        if cls.max_elements is not None and cls.elements > cls.max_elements:
+            raise ResourceLimitError("Element limit of {} exceeded".format(cls.max_elements))
+        cls.check_time()
+
+    @classmethod
+    def add_path_commands(cls, count:int):
+        '''Count the commands and numbers of a path'''
+        cls.path_commands += count
+        if cls.max_path_commands is not None and cls.path_commands > cls.max_path_commands:
+            raise ResourceLimitError("Path command limit of {} exceeded".format(cls.max_path_commands))
+        cls.check_time()
+
+    @classmethod
+    def remaining_path_commands(cls) -> int:
+        '''Number of path commands and numbers left before the limit or None'''
+        if cls.max_path_commands is None:
+            return None
+        return max(cls.max_path_commands - cls.path_commands, 0)
+
+    @classmethod
+    def add_vertices(cls, count:int):
+        '''Count flattened points'''
+        cls.vertices += count
+        if cls.max_vertices is not None and cls.vertices > cls.max_vertices:
+            raise ResourceLimitError("Vertex limit of {} exceeded".format(cls.max_vertices))
+        cls.check_time()
+
+    @classmethod
+    def fit_precision(cls, precision:float, length:float) -> float:
+        '''Return a precision that keeps flattening curves with a total
+        length of length within the remaining vertex budget.
+        '''
+        if cls.max_vertices is None or length <= 0:
+            return precision
+        remaining = cls.max_vertices - cls.vertices
+        if remaining <= 0:
+            raise ResourceLimitError("Vertex limit of {} exceeded".format(cls.max_vertices))
+        # A single curve may use at most half of what is left so the
+        # curves that follow still get some of the budget
+        remaining = max(remaining / 2, 1)
+        if precision <= 0 or length / precision > remaining:
+            if not cls._coarse_warning_sent:
+                logger.warning("Flattening curves more coarsely to stay below {} vertices".format(
+                    cls.max_vertices))
+                cls._coarse_warning_sent = True
+            return max(precision, length / remaining)
+        return precision
+
+
+class _ItemList(list):
+    '''A list of child items that invalidates the cached bounding box
+    of its owner whenever the list is modified.
+    Transformable children are linked back to every owner holding them
+    so invalidation can propagate up the tree.
+    '''
+
+    def __init__(self, owner, items=()):
+        self.owner = owner
+        list.__init__(self, items)
+        for item in self:
+            self._adopt(item)
+
+    def _adopt(self, item):
+        if isinstance(item, Transformable):
+            # An item can be in more than one list, e.g. after --force-layer
+            if not any(owner is self.owner for owner in item._bbox_parents):
+                item._bbox_parents.append(self.owner)
+
+    def _changed(self):
+        # The owner may not exist yet while the list is being deep copied
+        owner = getattr(self, "owner", None)
+        if owner is not None:
+            owner._invalidate_bbox()
+
+    def append(self, item):
+        self._adopt(item)
+        list.append(self, item)
+        self._changed()
+
+    def insert(self, index, item):
+        self._adopt(item)
+        list.insert(self, index, item)
+        self._changed()
+
+    def extend(self, items):
+        items = list(items)
+        for item in items:
+            self._adopt(item)
+        list.extend(self, items)
+        self._changed()
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+            for item in value:
+                self._adopt(item)
+        else:
+            self._adopt(value)
+        list.__setitem__(self, index, value)
+        self._changed()
+
+    def __delitem__(self, index):
+        list.__delitem__(self, index)
+        self._changed()
+
+    def remove(self, item):
+        list.remove(self, item)
+        self._changed()
+
+    def pop(self, *args):
+        item = list.pop(self, *args)
+        self._changed()
+        return item
+
+    def clear(self):
+        list.clear(self)
+        self._changed()
+
+
 class Transformable:
     '''Abstract class for objects that can be geometrically drawn & transformed'''
 
     # This list is all styles that should have the transformation matrix applied
     transformable_styles = ["stroke-width"]
 
-    def __init__(self, elt=None, parent_styles=None):
+    def __init__(self, elt=None, parent_styles=None, stylesheet=None):
+        # Cached bounding box, cleared by _invalidate_bbox()
+        self._bbox_cache = None
+        self._bbox_parents = []
         # a 'Transformable' is represented as a list of Transformable items
         self.items = []
         self.id = hex(id(self))
@@ -88,11 +272,20 @@ class Transformable:
         self.fill_even_odd = False
         # Unit transformation matrix on init
         self.matrix = Matrix()
+        # Matrix from this element to document coordinates, set by transform()
+        self.composed_matrix = None
         self.xscale = 1
         self.yscale = 1
+        # Transformable styles before scaling, set by transform_styles()
+        self._local_styles = None
         self.style = svg_defaults.copy() if not parent_styles and not isinstance(parent_styles, dict) else parent_styles.copy()
         self.rotation = 0
         self.viewport = Point(800, 600) # default viewport is 800x600
+        # Id of the referenced <clipPath> and the ClipPath object resolved by Svg.parse
+        self.clip_path_id = None
+        self.clip_path = None
+        # Rules from the document's <style> elements
+        self.stylesheet = stylesheet
         if elt is not None:
             self.id = elt.get('id', self.id)
 
@@ -107,15 +300,15 @@ class Transformable:
             if self.name == '':
                 self.name == self.id
 
-            # set fill_even_odd if property set
-            self.fill_even_odd = elt.get("fill-rule", '').lower() == 'evenodd'
-            if self.fill_even_odd:
-                logger.warning(f"Found unsupported attribute: 'fill-rule=evenodd' for {repr(self)}")
-
             # Find attributes of interest. The are overwritten by styles
             for style_key in svg_defaults:
                 self.style[style_key] = elt.get(style_key, self.style[style_key])
 
+            # Stylesheet rules override attributes but not the style attribute
+            if self.stylesheet is not None:
+                for name, value in self.stylesheet.resolve(elt).items():
+                    self._set_style(name, value)
+
             # parse styles and save as dictionary.
             if elt.get('style'):
                 for style in elt.get('style').split(";"):
@@ -125,13 +318,18 @@ class Transformable:
                         nv = style.split(":")
                         name = nv[ 0 ].strip()
                         value = nv[ 1 ].strip()
-                        if name in self.transformable_styles:
-                            value = list(re.search(r'(\d+\.?\d*)(\D+)?', value).groups())
-                            self.style[name] = float(value[0])
-                            if value[1] and value[1] not in unit_convert:
-                                logger.warning("Style '{}' has an unexpected unit: {}".format(style, value[1]))
-                        else:
-                            self.style[name] = value
+                        self._set_style(name, value)
+
+            # clip-path is not inherited so it is not kept in the styles
+            clip_ref = self.style.pop("clip-path", None) or elt.get("clip-path")
+            if clip_ref:
+                match = re.match(r'\s*url\(\s*[\'"]?#([^\'")\s]+)', clip_ref)
+                if match:
+                    self.clip_path_id = match.group(1)
+
+            if self.style.get("fill-rule"):
+                self.style["fill-rule"] = self.style["fill-rule"].strip().lower()
+            self.fill_even_odd = self.style.get("fill-rule") == "evenodd"
 
             # Parse transform attribute to update self.matrix
             self.get_transformations(elt)
@@ -139,6 +337,16 @@ class Transformable:
         if self.style.get("display") == "none":
             self.hidden = True
 
+    def _set_style(self, name, value):
+        '''Save a style, converting transformable styles to numbers'''
+        if name in self.transformable_styles:
+            value = list(re.search(r'(\d+\.?\d*)(\D+)?', value).groups())
+            self.style[name] = float(value[0])
+            if value[1] and value[1] not in unit_convert:
+                logger.warning("Style '{}' has an unexpected unit: {}".format(name, value[1]))
+        else:
+            self.style[name] = value
+
     @staticmethod
     def parse_name( tag ):
         '''Read and return name from xml data'''
@@ -148,8 +356,39 @@ class Transformable:
             'name' : m.group( 3 ),
         }
 
+    @property
+    def items(self):
+        '''List of child items. Modifying it clears the cached bounding box'''
+        return self._items
+
+    @items.setter
+    def items(self, items):
+        self._items = _ItemList(self, items)
+        self._invalidate_bbox()
+
+    def _invalidate_bbox(self):
+        '''Clear the cached bounding box of this element and all of its parents.
+        A parent can only hold a cached bounding box if its children do so
+        the walk stops at the elements without a cache.
+        '''
+        nodes = [self]
+        while nodes:
+            node = nodes.pop()
+            if node.__dict__.get("_bbox_cache") is not None:
+                node._bbox_cache = None
+                nodes.extend(node._bbox_parents)
+
     def bbox(self):
-        '''Bounding box of all points'''
+        '''Bounding box of all points.
+        The result is cached until the element is transformed
+        or its items are changed.
+        '''
+        if self._bbox_cache is None:
+            self._bbox_cache = self._calc_bbox()
+        return self._bbox_cache
+
+    def _calc_bbox(self):
+        '''Calculate the bounding box of all items'''
         b_boxes = [x.bbox() for x in self.items]
         if len( b_boxes ) < 1:
             return (Point(0, 0), Point(0, 0))
@@ -202,7 +441,6 @@ class Transformable:
                 self.matrix *= Matrix([sx, 0, 0, sy, 0, 0])
 
             if op == 'rotate':
-                self.rotation += arg[0]
                 cos_a = math.cos(math.radians(arg[0]))
                 sin_a = math.sin(math.radians(arg[0]))
                 if len(arg) != 1:
@@ -224,27 +462,67 @@ class Transformable:
         '''Any style in this classes transformable_styles
         will be scaled by the provided matrix.
         If it has a unit type it will convert it to the proper value first.
+
+        The untransformed values are kept so calling this again
+        with a different matrix does not compound the scaling.
         '''
+        if self._local_styles is None:
+            self._local_styles = {
+                style: self.style.get(style) for style in self.transformable_styles
+            }
         for style in self.transformable_styles:
-            if self.style.get(style):
-                has_units = re.search(r'\D', self.style[style] if isinstance(self.style[style], str) else '')
+            value = self._local_styles.get(style)
+            if value:
+                has_units = re.search(r'\D', value if isinstance(value, str) else '')
                 if has_units is None:
-                    self.style[style] = float(self.style[style]) * ((matrix.xscale()+matrix.yscale())/2)
+                    self.style[style] = float(value) * ((matrix.xscale()+matrix.yscale())/2)
                 else:
                     unit = has_units.group().lower()
-                    self.style[style] = float(re.search(r'\d', self.style[style]).group()) * unit_convert.get(unit, 1) * ((matrix.xscale()+matrix.yscale())/2)
+                    self.style[style] = float(re.search(r'\d', value).group()) * unit_convert.get(unit, 1) * ((matrix.xscale()+matrix.yscale())/2)
 
+    def _compose(self, matrix=None):
+        '''Store the product of the parent matrix and this element's
+        matrix as composed_matrix and return it.
+        '''
+        self.composed_matrix = self.matrix if matrix is None else matrix * self.matrix
+        self.transform_styles(self.composed_matrix)
+        self._invalidate_bbox()
+        # The clip path is in the user space of the element referencing it
+        if self.clip_path is not None:
+            self.clip_path.transform(self.composed_matrix)
+        return self.composed_matrix
+
+    def current_matrix(self):
+        '''Return the matrix mapping this element's coordinates to
+        document coordinates. Before transform() has been called
+        this is only the element's own matrix.
+        '''
+        if self.composed_matrix is None:
+            return self.matrix
+        return self.composed_matrix
+
+    def _apply_matrix(self, points:List[Point]) -> List[Point]:
+        '''Map a list of points from element to document coordinates'''
+        matrix = self.current_matrix()
+        if matrix.is_identity():
+            return points
+        return [matrix * pt for pt in points]
+
+    def _local_precision(self, precision:float) -> float:
+        '''Convert a precision in document units to element units'''
+        scale = self.current_matrix().mean_scale()
+        return precision / scale if scale else precision
 
     def transform(self, matrix=None):
-        '''Apply the provided matrix. Default (None)
-        If no matrix is supplied then recursively apply
-        it's already existing matrix to all items.
+        '''Compose the provided matrix with this element's matrix
+        and pass the result down to all items. Default (None)
+        If no matrix is supplied then only the element's own matrix is used.
+
+        No coordinates are changed. The composed matrix is applied
+        once when the element is flattened by segments(), so
+        transform() can be called again with a different matrix.
         '''
-        if matrix is None:
-            matrix = self.matrix
-        else:
-            matrix *= self.matrix
-        self.transform_styles(matrix)
+        matrix = self._compose(matrix)
         for x in self.items:
             x.transform(matrix)
 
@@ -311,13 +589,14 @@ class Svg(Transformable):
         append all svg element to items list
         '''
         self.filename = filename
+        ResourceLimits.start_stage("parse")
         tree = etree.parse(filename)
         self.root = tree.getroot()
         if self.root.tag != svg_ns + 'svg':
             raise TypeError('file %s does not seem to be a valid SVG file', filename)
 
         # Create a top Group to group all other items (useful for viewBox elt)
-        top_group = Group()
+        top_group = Group(stylesheet=StyleSheet(self.root))
         self.items.append(top_group)
 
         # SVG dimension
@@ -351,8 +630,30 @@ class Svg(Transformable):
         # Parse XML elements hierarchically with groups <g>
         top_group.append(self.root)
 
+        self._resolve_clip_paths()
+
         self.transform()
 
+    def _resolve_clip_paths(self):
+        '''Create a ClipPath for every element that references a <clipPath>'''
+        clip_elts = {elt.get('id'): elt for elt in self.root.iter(svg_ns + 'clipPath')}
+        stack = list(self.items)
+        while stack:
+            item = stack.pop()
+            if not isinstance(item, Transformable):
+                continue
+            stack.extend(item.items)
+            if item.clip_path_id is None:
+                continue
+            elt = clip_elts.get(item.clip_path_id)
+            if elt is None:
+                logger.warning("Unable to find clip path '{}' for {}".format(item.clip_path_id, repr(item)))
+            elif elt.get('clipPathUnits') == 'objectBoundingBox':
+                logger.warning("Unsupported clipPathUnits 'objectBoundingBox' in clip path '{}'".format(
+                    item.clip_path_id))
+            else:
+                item.clip_path = ClipPath(elt)
+
     def title(self):
         '''Returns svg title if exists. Otherwise try to return filename'''
         t = self.root.find(svg_ns + 'title')
@@ -389,8 +690,9 @@ class Group(Transformable):
             if elt_class is None:
                 logger.debug('No handler for element %s' % elt.tag)
                 continue
+            ResourceLimits.add_element()
             # instantiate elt associated class (e.g. <path>: item = Path(elt)
-            item = elt_class(elt, parent_styles=self.style)
+            item = elt_class(elt, parent_styles=self.style, stylesheet=self.stylesheet)
             # Apply group matrix to the newly created object
             # Actually, this is effectively done in Svg.__init__() through call to
             # self.transform(), so doing it here will result in the transformations
@@ -410,6 +712,130 @@ class Group(Transformable):
         '''Return json formatted dictionary of group'''
         return {'Group ' + self.id + " ({})".format( self.name ) : self.items}
 
+class StyleSheet:
+    '''Index of the rules in all <style> elements of a document.
+    Rules with simple selectors (tag, .class, #id, tag.class, tag#id, *)
+    are stored in dictionaries keyed by tag, class and id so the styles
+    of an element are found with a few lookups. Other selectors are ignored.
+    '''
+
+    _rule_re = re.compile(r'([^{}]+)\{([^{}]*)\}')
+    _selector_re = re.compile(r'^([A-Za-z][\w-]*|\*)?((?:[.#][\w-]+)*)$')
+
+    def __init__(self, root=None):
+        self.by_tag = {}
+        self.by_class = {}
+        self.by_id = {}
+        self._resolved = {}
+        self._order = 0
+        if root is not None:
+            for elt in root.iter(svg_ns + 'style'):
+                if elt.text:
+                    self.parse(elt.text)
+
+    def __bool__(self):
+        return bool(self.by_tag or self.by_class or self.by_id)
+
+    def parse(self, css:str):
+        '''Add all rules from a css string to the index'''
+        css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+        css = re.sub(r'@import[^;]*;', '', css)
+        for selectors, body in self._rule_re.findall(css):
+            declarations = {}
+            for declaration in body.split(';'):
+                if ':' in declaration:
+                    name, value = declaration.split(':', 1)
+                    declarations[name.strip()] = value.replace('!important', '').strip()
+            if not declarations:
+                continue
+            for selector in selectors.split(','):
+                self._add_rule(selector.strip(), declarations)
+        self._resolved = {}
+
+    def _add_rule(self, selector, declarations):
+        match = self._selector_re.match(selector)
+        if not selector or selector.startswith('@') or match is None:
+            logger.debug("Unsupported css selector: '{}'".format(selector))
+            return
+        tag = match.group(1) if match.group(1) != '*' else None
+        parts = re.findall(r'[.#][\w-]+', match.group(2))
+        ids = [p[1:] for p in parts if p[0] == '#']
+        classes = [p[1:] for p in parts if p[0] == '.']
+        specificity = (len(ids), len(classes), 1 if tag else 0)
+        rule = (specificity, self._order, tag, frozenset(ids), frozenset(classes), declarations)
+        self._order += 1
+
+        # Index the rule under its most specific part
+        if ids:
+            self.by_id.setdefault(ids[0], []).append(rule)
+        elif classes:
+            self.by_class.setdefault(classes[0], []).append(rule)
+        else:
+            self.by_tag.setdefault(tag or '*', []).append(rule)
+
+    def resolve(self, elt) -> dict:
+        '''Return the declarations matching an xml element
+        with the cascade (specificity, then document order) applied.
+        '''
+        if not self:
+            return {}
+        tag = Transformable.parse_name(elt.tag)['name']
+        elt_id = elt.get('id')
+        classes = frozenset(elt.get('class', '').split())
+        key = (tag, elt_id, classes)
+        if key in self._resolved:
+            return self._resolved[key]
+
+        rules = self.by_tag.get(tag, []) + self.by_tag.get('*', [])
+        if elt_id:
+            rules = rules + self.by_id.get(elt_id, [])
+        for cls in classes:
+            rules = rules + self.by_class.get(cls, [])
+
+        resolved = {}
+        for _, _, r_tag, r_ids, r_classes, declarations in sorted(rules, key=lambda r: r[:2]):
+            if (
+                (r_tag is None or r_tag == tag) and
+                (not r_ids or r_ids == {elt_id}) and
+                r_classes <= classes
+            ):
+                resolved.update(declarations)
+        self._resolved[key] = resolved
+        return resolved
+
+
+class ClipPath(Group):
+    '''Handle svg <clipPath> elements
+    The children of the clip path are parsed like a group.
+    The union of their areas is the visible region of the element
+    referencing the clip path.
+
+    This is not registered in svgClass because a clip path is never drawn.
+    '''
+
+    def __init__(self, elt=None, *args, **kwargs):
+        Group.__init__(self, elt, *args, **kwargs)
+        if elt is not None:
+            self.append(elt)
+
+    def __repr__(self):
+        return '<ClipPath ' + self.id + '>: ' + repr(self.items)
+
+    def regions(self, precision=0) -> List[List[Point]]:
+        '''Return the clip areas flattened to rings of points
+        in document coordinates.
+        '''
+        regions = []
+        stack = list(self.items)
+        while stack:
+            item = stack.pop()
+            if isinstance(item, Group):
+                stack.extend(item.items)
+            elif hasattr(item, "segments"):
+                regions.extend(seg for seg in item.segments(precision) if len(seg) > 2)
+        return regions
+
+
 class Matrix:
     ''' SVG transformation matrix and its operations
     a SVG matrix is represented as a list of 6 values [a, b, c, d, e, f]
@@ -450,6 +876,14 @@ class Matrix:
     def __str__(self):
         return str(self.vect)
 
+    def is_identity(self):
+        '''Return True if the matrix does not change points'''
+        return self.vect == [1, 0, 0, 1, 0, 0]
+
+    def mean_scale(self):
+        '''Return the geometric mean of the x and y scale factors'''
+        return math.sqrt(abs(self.vect[0]*self.vect[3] - self.vect[1]*self.vect[2]))
+
     def xscale(self):
         '''Return the rotated x scalar value'''
         return self.vect[0]/abs(self.vect[0]) * math.sqrt(self.vect[0]**2 + self.vect[2]**2)
@@ -487,7 +921,13 @@ class Path(Transformable):
     def parse(self, path_str:str):
         """Parse svg path string and build elements list"""
 
-        path_list = re.findall(number_re + r"|\ *[%s]\ *" % Path.COMMANDS, path_str)
+        tokens = re.finditer(number_re + r"|\ *[%s]\ *" % Path.COMMANDS, path_str)
+        # Stop reading one past the limit so a huge path is never all in memory
+        remaining = ResourceLimits.remaining_path_commands()
+        if remaining is not None:
+            tokens = itertools.islice(tokens, remaining + 1)
+        path_list = [token.group() for token in tokens]
+        ResourceLimits.add_path_commands(len(path_list))
 
         path_list.reverse()
 
@@ -628,22 +1068,64 @@ class Path(Transformable):
     def __repr__(self):
         return '<Path ' + self.id + '>'
 
+    def transform(self, matrix=None):
+        '''Compose the provided matrix with this path's matrix.
+        The path instructions are kept in path coordinates
+        and only mapped to document coordinates by segments().
+        '''
+        self._compose(matrix)
+
+    def _calc_bbox(self) -> Tuple[Point, Point]:
+        '''Bounding box of all path instruction points
+        mapped to document coordinates.
+        '''
+        points = []
+        for item in self.items:
+            if isinstance(item, MoveTo):
+                points.append(item.dest)
+            elif isinstance(item, Bezier):
+                points.extend(item.pts)
+            elif isinstance(item, Arc):
+                points.extend(item.segments(max(item.rx, item.ry) / 4))
+            else:
+                points.extend(item.segments())
+        if not points:
+            return (Point(0, 0), Point(0, 0))
+        points = self._apply_matrix(points)
+        return (
+            Point(min(p.x for p in points), min(p.y for p in points)),
+            Point(max(p.x for p in points), max(p.y for p in points)),
+        )
+
     def segments(self, precision=0) -> List[Segment]:
         '''Return a list of segments, each segment is ended by a MoveTo.
            A segment is a list of Points'''
         ret = []
+        local_precision = ResourceLimits.fit_precision(
+            self._local_precision(precision), self._curve_length())
         # group items separated by MoveTo
         for moveTo, group in itertools.groupby(self.items,
                 lambda x: isinstance(x, MoveTo)):
             # Use only non MoveTo item
             if not moveTo:
                 # Generate segments for each relevant item
-                seg = [x.segments(precision) for x in group]
-                # Merge all segments into one
-                ret.append(list(itertools.chain.from_iterable(seg)))
+                seg = [x.segments(local_precision) for x in group]
+                # Merge all segments into one and map it to document coordinates
+                ret.append(self._apply_matrix(list(itertools.chain.from_iterable(seg))))
+                ResourceLimits.add_vertices(len(ret[-1]))
 
         return ret
 
+    def _curve_length(self) -> float:
+        '''Rough length of all curves in path coordinates'''
+        length = 0
+        for item in self.items:
+            if isinstance(item, Bezier):
+                length += item.r_length()
+            elif isinstance(item, Arc):
+                length += max(item.rx, item.ry) * abs(item.angles[1] - item.angles[0])
+        return length
+
     def simplify(self, precision:float) -> List[Segment]:
         '''Simplify segment with precision:
            Remove any point which are ~aligned'''
@@ -690,8 +1172,9 @@ class Polygon(Path):
         ''' Return list of segments '''
 
         seg = [x.segments(precision) for x in self.items]
+        ResourceLimits.add_vertices(sum(len(x) for x in seg))
 
-        return [list(itertools.chain.from_iterable(seg))]
+        return [self._apply_matrix(list(itertools.chain.from_iterable(seg)))]
 
 
 class Ellipse(Transformable):
@@ -728,7 +1211,7 @@ class Ellipse(Transformable):
     def __repr__(self):
         return '<Ellipse ' + self.id + '>'
 
-    def bbox(self) -> Tuple[Point, Point]:
+    def _calc_bbox(self) -> Tuple[Point, Point]:
         '''Approximate the bounding box for the given ellipse by
         decomposing the ellipse into a small number of segments.
 
@@ -736,11 +1219,10 @@ class Ellipse(Transformable):
         it is much easier to compute the bounding box of segments.
         '''
         if self.arc:
-            return Transformable.bbox(self)
+            return self.path.bbox()
 
-        points = self.segments((self.rx+self.ry) / 8)
-        if isinstance(points[0], Iterable):
-            points = list(itertools.chain.from_iterable(points))
+        # Not counted against ResourceLimits.max_vertices like segments()
+        points = self._apply_matrix(self._local_segments((self.rx+self.ry) / 8))
 
         xmin = min([p.x for p in points])
         xmax = max([p.x for p in points])
@@ -750,22 +1232,13 @@ class Ellipse(Transformable):
         return (Point(xmin,ymin),Point(xmax,ymax))
 
     def transform(self, matrix=None):
-        '''Apply the provided matrix. Default (None)
-        If no matrix is supplied then recursively apply
-        it's already existing matrix to all items.
-        Also apply to center, rx, and ry
+        '''Compose the provided matrix with this element's matrix.
+        center, rx and ry are left untouched, the composed matrix
+        is applied to the points generated by segments().
         '''
-        if matrix is None:
-            matrix = self.matrix
-        else:
-            matrix *= self.matrix
-        self.transform_styles(matrix)
-
-        self.center = matrix * self.center
-        self.rx = matrix.xscale()*self.rx
-        self.ry = matrix.yscale()*self.ry
-        self.rotation += math.degrees(matrix.rot().angle)
-        self.matrix= matrix
+        self._compose(matrix)
+        if self.arc:
+            self.path.transform(matrix)
 
     def P(self, t) -> Point:
         '''Return a Point on the Ellipse for t in [0..1] or % from angle 0 to the full circle.
@@ -780,13 +1253,23 @@ class Ellipse(Transformable):
         if self.arc:
             segments = self.path.segments(precision)
             return segments
+        precision = ResourceLimits.fit_precision(
+            self._local_precision(precision), 2 * math.pi * max(self.rx, self.ry))
+        points = self._local_segments(precision)
+        ResourceLimits.add_vertices(len(points))
+        return [self._apply_matrix(points)]
+
+    def _local_segments(self, precision=0) -> List[Point]:
+        '''Flatten the ellipse in element coordinates'''
         if max(self.rx, self.ry) < precision:
-            return [[self.center]]
+            return [self.center]
 
         p = [(0,self.P(0)), (1, self.P(1))]
         d = 2 * max(self.rx, self.ry)
 
-        while d > precision:
+        # Like Bezier.segments stop at about 1000 points so a precision
+        # of 0 or absurd radii cannot subdivide forever
+        while d > precision and len(p) < 1000:
             for (t1,_),(t2,_) in zip(p[:-1],p[1:]):
                 t = t1 + (t2 - t1)/2.
                 p.append((t, self.P(t)))
@@ -794,7 +1277,7 @@ class Ellipse(Transformable):
             d = Segment(p[0][1],p[1][1]).length()
 
         ret = [x.rot(math.radians(self.rotation), x=self.center.x, y=self.center.y) for __,x in p]
-        return [ret]
+        return ret
 
     def simplify(self, __):
         '''Return self because a 3 point representation is already simple'''
@@ -955,18 +1438,14 @@ class Arc(Ellipse):
         elif self.sweep_flag and self.angles[1] < self.angles[0]:
             self.angles[1] += 2*math.pi
 
-    def transform(self, matrix=None):
-        super().transform(matrix)
-        self.end_pts[0] = self.matrix * self.end_pts[0]
-        self.end_pts[1] = self.matrix * self.end_pts[1]
-
     def segments(self, precision=0) -> List[Segment]:
         '''This returns segments as expected by the
         Path object. (A list of points. Not a list of lists of points)
+        The points are in the coordinates of the parent path.
         '''
         if max(self.rx, self.ry) < precision:
             return self.end_pts
-        return Ellipse.segments(self, precision)[0]
+        return self._local_segments(precision)
 
     def P(self, t) -> Point:
         '''Return a Point on the Arc for t in [0..1] where t is the % from
@@ -1062,33 +1541,25 @@ class Line(Transformable):
     def __repr__(self):
         return '<Line ' + self.id + '>'
 
-    def bbox(self) -> Tuple[Point, Point]:
+    def _calc_bbox(self) -> Tuple[Point, Point]:
         '''Bounding box'''
-        xmin = min([p.x for p in (self.P1, self.P2)])
-        xmax = max([p.x for p in (self.P1, self.P2)])
-        ymin = min([p.y for p in (self.P1, self.P2)])
-        ymax = max([p.y for p in (self.P1, self.P2)])
+        points = self._apply_matrix([self.P1, self.P2])
+        xmin = min([p.x for p in points])
+        xmax = max([p.x for p in points])
+        ymin = min([p.y for p in points])
+        ymax = max([p.y for p in points])
 
         return (Point(xmin,ymin), Point(xmax,ymax))
 
     def transform(self, matrix=None):
-        '''Apply the provided matrix. Default (None)
-        If no matrix is supplied then recursively apply
-        it's already existing matrix to all items.
+        '''Compose the provided matrix with this element's matrix.
+        The end points are mapped when segments() is called.
         '''
-        if matrix is None:
-            matrix = self.matrix
-        else:
-            matrix *= self.matrix
-        self.transform_styles(matrix)
-
-        self.P1 = matrix * self.P1
-        self.P2 = matrix * self.P2
-        self.segment = Segment(self.P1, self.P2)
+        self._compose(matrix)
 
     def segments(self, __=0) -> List[Segment]:
         '''Return the segment of the line'''
-        return [self.segment.segments()]
+        return [self._apply_matrix(self.segment.segments())]
 
 
 class Text(Transformable):
@@ -1119,7 +1590,11 @@ class Text(Transformable):
     tag = 'text'
 
     default_font = None
+    use_stroke_font = False
+    use_fontconfig = True
     _system_fonts = {}
+    _font_lookup = {}
+    _font_lock = threading.Lock()
     _os_font_paths = {
         "Darwin": ["/Library/Fonts", "~/Library/Fonts"],
         "Linux": ["/usr/share/fonts","/usr/local/share/fonts","~/.local/share/fonts"],
@@ -1233,7 +1708,7 @@ class Text(Transformable):
 
         self.text = [] if elt.text is None else [(elt.text, self)]
         for child in list(elt):
-            Text(child, self)
+            Text(child, self, stylesheet=self.stylesheet)
         if parent is not None:
             parent.text.extend(self.text)
             if elt.tail is not None:
@@ -1253,93 +1728,125 @@ class Text(Transformable):
         with both or regular if italic or bold are set but not found.
 
         If the target font cannot be found then the default is used if set and found.
+        If that can't be found either, or Text.use_stroke_font is set, the
+        built-in stroke font is used.
         '''
+        global _font_warning_sent
+        if Text.use_stroke_font:
+            return strokefont.FONT_FILE
         if self.font_family is None:
             if Text.default_font is None:
-                global _font_warning_sent
                 if not _font_warning_sent:
-                    logger.error("Unable to find font because no font was specified.")
+                    logger.error("No font was specified, using the built-in stroke font.")
                     _font_warning_sent = True
-                return None
+                return strokefont.FONT_FILE
             self.font_family = Text.default_font
         fonts = [fnt.strip().strip("'") for fnt in self.font_family.split(",")]
         if Text.default_font is not None: fonts.append(Text.default_font)
 
-        font_files = None
-        target_font = None
+        bold = self.bold is not None and self.bold.lower() != "normal"
+        italic = self.italic is not None and self.italic.lower() != "normal"
+
         for fnt in fonts:
-            if Text.load_system_fonts().get(fnt) is not None:
-                target_font = fnt
-                font_files = Text.load_system_fonts().get(fnt)
+            if fnt.lower() == strokefont.FAMILY:
+                return strokefont.FONT_FILE
+            entry = Text._load_font_lookup().get((fnt.lower(), bold, italic))
+            if entry is not None:
                 break
-        if font_files is None:
-            # We are unable to find a font and since there is no default font stop building font data
-            logger.error("Unable to find font(s) \"{}\"{}".format(
+        else:
+            logger.error("Unable to find font(s) \"{}\"{}, using the built-in stroke font".format(
                 self.font_family,
-                " and no default font specified" if Text.default_font is None else f" or default font \"{Text.default_font}\""
+                "" if Text.default_font is None else f" or default font \"{Text.default_font}\""
             ))
-            self.paths = []
-            return
+            return strokefont.FONT_FILE
 
-        bold = self.bold is not None and self.bold.lower() != "normal"
-        italic = self.italic is not None and self.italic.lower() != "normal"
+        if entry[1] is not None:
+            logger.warning(entry[1])
+            # Only warn once for each font and style
+            Text._load_font_lookup()[(fnt.lower(), bold, italic)] = (entry[0], None)
+        return entry[0]
+
+    @staticmethod
+    def _load_font_lookup() -> dict:
+        '''Build the index used by find_font_file.
+        It maps (lower case family, bold, italic) to the font file
+        to use and the warning to print if it is not the requested style.
+        The style fall back rules are resolved here once for every
+        family so finding a font is a single lookup.
+        '''
+        if Text._font_lookup:
+            return Text._font_lookup
 
         reg = ["Regular", "Book"]
         bol = ["Bold", "Demibold"]
         ita = ["Italic", "Oblique"]
+        searches = {
+            (False, False): reg,
+            (True, False): bol,
+            (False, True): ita,
+            (True, True): [f"{b} {i}" if n == 0 else f"{i} {b}" for b in bol for i in ita for n in range(2)],
+        }
 
-        search = reg
-        if bold and not italic:
-            search = bol
-        elif italic and not bold:
-            search = ita
-        elif italic and bold:
-            search = [f"{b} {i}" if n == 0 else f"{i} {b}" for b in bol for i in ita for n in range(2)]
-        tar_font = list(filter(None, [font_files.get(style) for style in search]))
-        if len(tar_font) == 0 and len(font_files.keys()) == 1:
-            tar_font = [font_files[list(font_files.keys())[0]]]
-            logger.warning("Font \"{}\" does not natively support style \"{}\" using \"{}\" instead".format(
-                target_font, search[0], list(font_files.keys())[0]))
-        elif len(tar_font) == 0 and italic and bold:
-            orig_search = search[0]
-            search = []
-            search.extend(ita)
-            search.extend(bol)
-            search.extend(reg)
-            search.extend(list(font_files.keys()))
-            for style in search:
-                if font_files.get(style) is not None:
-                    tar_font = [font_files[style]]
-                    logger.warning("Font \"{}\" does not natively support style \"{}\" using \"{}\" instead".format(
-                        target_font, orig_search, style))
-                    break
-        return tar_font[0]
+        lookup = {}
+        for family, font_files in Text.load_system_fonts().items():
+            styles = list(font_files.keys())
+            for (bold, italic), search in searches.items():
+                key = (family.lower(), bold, italic)
+                if key in lookup:
+                    continue
+                found = [style for style in search if style in font_files]
+                if found:
+                    lookup[key] = (font_files[found[0]], None)
+                    continue
+
+                # The requested style does not exist so pick the closest one
+                fallback = styles
+                if len(styles) > 1 and italic and bold:
+                    fallback = ita + bol + reg + styles
+                elif len(styles) > 1:
+                    fallback = reg + styles
+                style = [style for style in fallback if style in font_files][0]
+                lookup[key] = (font_files[style], "Font \"{}\" does not natively support style \"{}\" using \"{}\" instead".format(
+                    family, search[0], style))
+
+        Text._font_lookup = lookup
+        return lookup
 
 
     def convert_to_path(self, auto_transform=True):
         ''' Read the vector data from the ttf/otf file and
-        convert it into a path string for each letter and
-        parse the path string by a Path instance.
+        convert it into a path for each letter.
+        Glyphs of runs using the built-in stroke font get their own
+        stroked style, see stroke_paths().
 
         if auto_transform is True then this calls self.transform()
-        at the end to apply all transformations on the paths.
-
-        This should only be called once so double check transform()
-        is never called elsewhere.
+        at the end to compose the matrices of all the paths.
         '''
         self.paths = []
+        self._invalidate_bbox()
         if not self.text: return
         prev_origin = self.text[0][1].origin
 
         offset = Point(prev_origin.x, prev_origin.y)
+        stroke = self.style.get("stroke")
+        if not stroke or stroke == "none":
+            stroke = self.style.get("fill")
+        stroke_style = dict(self.style, fill="none")
+        stroke_style["stroke"] = stroke if stroke and stroke != "none" else "#000000"
         for text, attrib in self.text:
 
-            if attrib.font_file is None or attrib.font_family is None:
+            if attrib.font_file is None:
                 continue
             size = attrib.size
-            ttf = ttFont.TTFont(attrib.font_file)
-            offset.y = attrib.origin.y + ttf["head"].unitsPerEm
-            scale = size/offset.y
+            font = FontCache.get(attrib.font_file)
+            stroked = isinstance(font, StrokeFont)
+            if stroked:
+                scale = size/font.units_per_em
+                # This is scaled by the text matrix in .transform()
+                stroke_style["stroke-width"] = size * strokefont.STROKE_WIDTH
+            else:
+                offset.y = attrib.origin.y + font.units_per_em
+                scale = size/offset.y
 
             if prev_origin != attrib.origin:
                 prev_origin = attrib.origin
@@ -1348,34 +1855,38 @@ class Text(Transformable):
             path = []
             for char in text:
 
-                path_buff = ""
-                try: glf = ttf.getGlyphSet()[ttf.getBestCmap()[ord(char)]]
-                except KeyError:
+                glyph_name = font.glyph_name(char)
+                if glyph_name is None:
                     logger.warning('Unsupported character in <text> element "{}"'.format(char))
                     #txt = txt.replace(char, "")
                     continue
 
-                pen = SVGPathPen(ttf.getGlyphSet())
-                glf.draw(pen)
+                items, width = font.outline(glyph_name)
 
-                for cmd in pen._commands:
-                    path_buff += cmd + ' '
-
-                if len(path_buff) > 0:
-                    path.append(Path())
-                    path[-1].parse(path_buff)
+                if items:
+                    if stroked:
+                        path.append(StrokeGlyph(items, stroke_style))
+                        path[-1].id = self.id
+                    else:
+                        path.append(Glyph(attrib.font_file, glyph_name, items))
+                    path[-1]._bbox_parents.append(self)
                     # Apply the scaling then the translation
                     translate = Matrix([1,0,0,-1,offset.x,size+attrib.origin.y]) * Matrix([scale,0,0,scale,0,0])
-                    # This queues the translations until .transform() is called
+                    # This is composed with the text matrix by .transform()
                     path[-1].matrix =  translate * path[-1].matrix
 
-                offset.x += (scale*glf.width)
+                offset.x += (scale*width)
 
             self.paths.append(path)
+
+        # Font outlines are drawn with the nonzero fill rule
+        if not self.style.get("fill-rule"):
+            self.style["fill-rule"] = "nonzero"
+
         if auto_transform:
             self.transform()
 
-    def bbox(self) -> Tuple[Point, Point]:
+    def _calc_bbox(self) -> Tuple[Point, Point]:
         '''Find the bounding box of all the paths that make
         each letter.
         This will only work if there are available paths.
@@ -1391,68 +1902,121 @@ class Text(Transformable):
         )
 
     def transform(self, matrix=None):
-        '''Apply the provided matrix. Default (None)
-        If no matrix is supplied then recursively apply
-        it's already existing matrix to all items.
+        '''Compose the provided matrix with this element's matrix
+        and pass the result down to the paths of every glyph.
         '''
-        if matrix is None:
-            matrix = self.matrix
-        else:
-            matrix *= self.matrix
-        self.transform_styles(matrix)
-
-        self.origin = matrix * self.origin
+        matrix = self._compose(matrix)
         for paths in self.paths:
             for path in paths:
                 path.transform(matrix)
+                if isinstance(path, StrokeGlyph):
+                    # The stroke width is in text units not font units
+                    path.transform_styles(matrix)
 
     def segments(self, precision=0) -> List[Segment]:
-        '''Get a list of all points in all paths
+        '''Get a list of all points in all outline glyphs
         with provide precision.
         This will only work if there are available paths.
         '''
         segments = []
         for paths in self.paths:
             for path in paths:
-                segments.extend(path.segments(precision))
+                if isinstance(path, Glyph):
+                    segments.extend(path.segments(precision))
         return segments
 
+    def stroke_paths(self) -> List[Path]:
+        '''Get the glyphs of the runs using the built-in stroke font.
+        They are not part of segments() since they are stroked
+        with their own style instead of the style of the text.
+        '''
+        return [path for paths in self.paths for path in paths if isinstance(path, StrokeGlyph)]
+
     @staticmethod
     def load_system_fonts(reload:bool=False) -> List[dict]:
         '''Find all fonts in common locations on the file system
-        To properly read all fonts they need to be parsed so this
-        is inherently slow on systems with many fonts.
-        To prevent long parsing time all the results are cached
-        and the cached results are returned next time this function
-        is called.
+        On Linux the fonts known to fontconfig are used if it is
+        installed and Text.use_fontconfig is True.
+        Otherwise the names of every font are kept in an index in the user
+        cache directory so only fonts added or changed since the
+        last run need to be parsed.
+        The results are also cached in memory and returned
+        next time this function is called.
         If a force reload of all indexed fonts is desirable setting
-        reload to True will clear the cache and re-index the system.
+        reload to True will clear both caches and re-index the system.
+
+        If the fonts are being loaded by start_font_discovery()
+        this waits for it to finish.
         '''
-        if reload:
-            Text._system_fonts = {}
-        if len(Text._system_fonts.keys()) < 1:
-            fonts_files = []
-            logger.info("Loading system fonts.")
-            for path in Text._os_font_paths[platform.system()]:
-                try:
-                    fonts_files.extend([os.path.join(dp, f) for dp, dn, fn in os.walk(os.path.expanduser(path)) for f in fn])
-                except:
-                    pass
-
-            for font_file in fonts_files:
-                try:
-                    font = ttFont.TTFont(font_file)
-                    name = font["name"].getName(1,1,0).toStr()
-                    style = font["name"].getName(2,1,0).toStr()
-                    if Text._system_fonts.get(name) is None:
-                        Text._system_fonts[name] = {style:font_file}
-                    elif Text._system_fonts[name].get(style) is None:
-                        Text._system_fonts[name][style] = font_file
-                except:
-                    pass
-            logger.debug(f"  Found {len(Text._system_fonts.keys())} fonts in system")
+        with Text._font_lock:
+            if reload:
+                Text._system_fonts = {}
+                Text._font_lookup = {}
+            if len(Text._system_fonts.keys()) < 1:
+                logger.info("Loading system fonts.")
+                fonts = None
+                if Text.use_fontconfig and platform.system() == "Linux":
+                    fonts = fontconfig_fonts()
+                if not fonts:
+                    fonts = FontIndex(Text._os_font_paths[platform.system()]).load(reload)
+                Text._system_fonts = fonts
+                logger.debug(f"  Found {len(Text._system_fonts.keys())} fonts in system")
         return Text._system_fonts
 
+    @staticmethod
+    def start_font_discovery() -> threading.Thread:
+        '''Start loading the system fonts in a background thread
+        so it can overlap with parsing. The first text element that
+        needs a font waits for it in load_system_fonts().
+        '''
+        thread = threading.Thread(target=Text.load_system_fonts, name="font-discovery", daemon=True)
+        thread.start()
+        return thread
+
+
+class Glyph(Path):
+    '''A single character of a Text element.
+    The outline is in font units and shared with every other use
+    of the glyph, the matrix places it in the text.
+    Flattened outlines come from FlatGlyphCache.
+    '''
+
+    def __init__(self, font_file:str, glyph_name:str, items:tuple):
+        Path.__init__(self)
+        self.font_file = font_file
+        self.glyph_name = glyph_name
+        self.items.extend(items)
+
+    def segments(self, precision=0) -> List[Segment]:
+        '''Return the flattened rings of the glyph mapped to document coordinates'''
+        font = FontCache.get(self.font_file)
+        local_precision = self._local_precision(precision)
+        if ResourceLimits.max_vertices is not None:
+            local_precision = ResourceLimits.fit_precision(local_precision, self._curve_length())
+        tolerance = FlatGlyphCache.tolerance(local_precision, font.units_per_em)
+
+        # Only scale and translate the cached coordinates
+        a, b, c, d, e, f = self.current_matrix().vect
+        ret = []
+        for ring in FlatGlyphCache.get(font, self.glyph_name, tolerance):
+            coords = iter(ring)
+            ret.append([Point(a*x + c*y + e, b*x + d*y + f) for x, y in zip(coords, coords)])
+            ResourceLimits.add_vertices(len(ret[-1]))
+        return ret
+
+
+class StrokeGlyph(Path):
+    '''A single character of a Text element in the built-in stroke font.
+    It is drawn with open strokes which must not be closed into polygons.
+    '''
+
+    # Not the handler of <path> elements
+    tag = None
+
+    def __init__(self, items:tuple, style:dict):
+        Path.__init__(self, parent_styles=style)
+        self.items.extend(items)
+
 
 class JSONEncoder(json.JSONEncoder):
     ''' overwrite JSONEncoder for svg classes which have defined a .json() method '''
@@ -19,7 +19,10 @@ Helper classes to combine and calculate the points
 from a svg object into a single continuous line
 '''
 
+import bisect
 import copy
+import math
+import random
 from typing import List, Tuple
 
 from svg2mod import svg
@@ -179,6 +182,182 @@ class LineSegment:
 
 #----------------------------------------------------------------------------
 
+class EdgeGrid:
+    '''Uniform grid over the edges of a polyline so line queries only
+    have to look at the edges in the cells the line passes over.
+    Each edge is stored in every cell its bounding box overlaps.
+    Edge i goes from points[i] to points[i+1].
+    '''
+
+    #------------------------------------------------------------------------
+
+    def __init__( self, points: List[svg.Point], bbox: Tuple[svg.Point, svg.Point] = None ):
+
+        self.count = max( len( points ) - 1, 0 )
+        self.cells = {}
+        if self.count < 1:
+            return
+
+        if bbox is None:
+            bbox = (
+                svg.Point( min( p.x for p in points ), min( p.y for p in points ) ),
+                svg.Point( max( p.x for p in points ), max( p.y for p in points ) ),
+            )
+        self.min_x = bbox[ 0 ].x
+        self.min_y = bbox[ 0 ].y
+        # About one edge per cell
+        self.size = max( 1, int( math.sqrt( self.count ) ) )
+        self.cell_w = ( bbox[ 1 ].x - self.min_x ) / self.size or 1
+        self.cell_h = ( bbox[ 1 ].y - self.min_y ) / self.size or 1
+
+        for i in range( self.count ):
+            p, q = points[ i ], points[ i + 1 ]
+            cols = self._range( min( p.x, q.x ), max( p.x, q.x ), self.min_x, self.cell_w )
+            rows = self._range( min( p.y, q.y ), max( p.y, q.y ), self.min_y, self.cell_h )
+            for col in cols:
+                for row in rows:
+                    self.cells.setdefault( ( col, row ), [] ).append( i )
+
+    #------------------------------------------------------------------------
+
+    def _range( self, low, high, origin, step ):
+        # Clamped to the grid, anything past the edges is in the outer cells
+        first = min( max( int( math.floor( ( low - origin ) / step ) ), 0 ), self.size - 1 )
+        last = min( max( int( math.floor( ( high - origin ) / step ) ), 0 ), self.size - 1 )
+        return range( first, last + 1 )
+
+    #------------------------------------------------------------------------
+
+    def query( self, p: svg.Point, q: svg.Point ) -> List[int]:
+        '''Return the sorted indices of all edges that may
+        intersect the segment p -> q.
+        '''
+        if self.count < 1:
+            return []
+        cols = self._range( min( p.x, q.x ), max( p.x, q.x ), self.min_x, self.cell_w )
+        rows = self._range( min( p.y, q.y ), max( p.y, q.y ), self.min_y, self.cell_h )
+        if len( cols ) * len( rows ) == 1:
+            return self.cells.get( ( cols[ 0 ], rows[ 0 ] ), [] )
+
+        found = set()
+        for col in cols:
+            for row in rows:
+                found.update( self.cells.get( ( col, row ), () ) )
+        return sorted( found )
+
+#----------------------------------------------------------------------------
+
+class SweepLine:
+    '''Ordered set of the edges crossing a sweep line, kept in a treap
+    so adding or removing an edge and finding the edges next to it take
+    O(log n) steps on average. Edges are the integers 0 to size - 1 and
+    above( a, b ) tells if edge a goes above edge b.
+    '''
+
+    #------------------------------------------------------------------------
+
+    def __init__( self, size: int, above ):
+
+        self.above = above
+        self.root = None
+        self.left = [ None ] * size
+        self.right = [ None ] * size
+        self.parent = [ None ] * size
+        # Seeded so the shape of the tree is the same every run
+        generator = random.Random( size )
+        self.priority = [ generator.random() for _ in range( size ) ]
+
+    #------------------------------------------------------------------------
+
+    def _rotate_up( self, node: int ):
+        parent = self.parent[ node ]
+        grandparent = self.parent[ parent ]
+        if self.left[ parent ] == node:
+            self.left[ parent ] = self.right[ node ]
+            if self.right[ node ] is not None:
+                self.parent[ self.right[ node ] ] = parent
+            self.right[ node ] = parent
+        else:
+            self.right[ parent ] = self.left[ node ]
+            if self.left[ node ] is not None:
+                self.parent[ self.left[ node ] ] = parent
+            self.left[ node ] = parent
+        self.parent[ parent ] = node
+        self.parent[ node ] = grandparent
+        if grandparent is None:
+            self.root = node
+        elif self.left[ grandparent ] == parent:
+            self.left[ grandparent ] = node
+        else:
+            self.right[ grandparent ] = node
+
+    #------------------------------------------------------------------------
+
+    def add( self, edge: int ):
+        '''Insert the edge where it starts between the edges below and above it'''
+
+        parent, node, above = None, self.root, False
+        while node is not None:
+            parent, above = node, self.above( edge, node )
+            node = self.right[ node ] if above else self.left[ node ]
+
+        self.left[ edge ] = self.right[ edge ] = None
+        self.parent[ edge ] = parent
+        if parent is None:
+            self.root = edge
+        elif above:
+            self.right[ parent ] = edge
+        else:
+            self.left[ parent ] = edge
+
+        while parent is not None and self.priority[ edge ] > self.priority[ parent ]:
+            self._rotate_up( edge )
+            parent = self.parent[ edge ]
+
+    #------------------------------------------------------------------------
+
+    def remove( self, edge: int ):
+        '''Take the edge out of the set'''
+
+        # Rotate it down to a leaf first
+        while self.left[ edge ] is not None or self.right[ edge ] is not None:
+            left, right = self.left[ edge ], self.right[ edge ]
+            if right is None or ( left is not None and self.priority[ left ] > self.priority[ right ] ):
+                self._rotate_up( left )
+            else:
+                self._rotate_up( right )
+
+        parent = self.parent[ edge ]
+        if parent is None:
+            self.root = None
+        elif self.left[ parent ] == edge:
+            self.left[ parent ] = None
+        else:
+            self.right[ parent ] = None
+        self.parent[ edge ] = None
+
+    #------------------------------------------------------------------------
+
+    def neighbor_below( self, edge: int ) -> int:
+        '''Return the edge right below edge or None'''
+        return self._next( edge, self.left, self.right )
+
+    def neighbor_above( self, edge: int ) -> int:
+        '''Return the edge right above edge or None'''
+        return self._next( edge, self.right, self.left )
+
+    def _next( self, node: int, forward: List[int], backward: List[int] ) -> int:
+        if forward[ node ] is not None:
+            node = forward[ node ]
+            while backward[ node ] is not None:
+                node = backward[ node ]
+            return node
+        while self.parent[ node ] is not None and forward[ self.parent[ node ] ] == node:
+            node = self.parent[ node ]
+        return self.parent[ node ]
+
+#----------------------------------------------------------------------------
+
 class PolygonSegment:
     ''' A polygon should be a collection of segments
     creating an enclosed or manifold shape.
@@ -194,81 +373,237 @@ class PolygonSegment:
 
     def __init__( self, points:List):
 
-        self.points = [points[0]]
+        self.points = None
+        self.bbox = None
+        self._edge_grid = None
+        self._set_points( points )
 
-        for point in points:
-            if self.points[-1] != point:
-                self.points.append(point)
 
+    #------------------------------------------------------------------------
 
-        self.bbox = None
+    def _set_points(self, points: List[svg.Point], tolerance: float = None):
+        ''' Replace the points, removing duplicate points in a row,
+        and update the bounding box. With a tolerance points in the
+        middle of a straight run are removed too.
+        '''
+        # Comparing the coordinates directly skips the type checks in Point.__eq__
+        self.points = [points[0]] + [
+            q for p, q in zip(points, points[1:]) if p.x != q.x or p.y != q.y
+        ]
+        if tolerance is not None:
+            self.points = self._drop_collinear(self.points, tolerance)
+        self._edge_grid = None
         self.calc_bbox()
 
+    #------------------------------------------------------------------------
+
+    @staticmethod
+    def _drop_collinear(points: List[svg.Point], tolerance: float) -> List[svg.Point]:
+        ''' Remove the points within tolerance of the line from the last
+        point kept to the next point when the path keeps going forward.
+        The points already dropped since the last point kept are checked
+        against the longer line too, so the error never adds up past the
+        tolerance. The first and last points are always kept.
+        '''
+        def near(before, after, point):
+            # Within tolerance of the line and between its ends
+            dx = after.x - before.x
+            dy = after.y - before.y
+            length = dx * dx + dy * dy
+            cross = (point.x - before.x) * dy - (point.y - before.y) * dx
+            along = (point.x - before.x) * dx + (point.y - before.y) * dy
+            return 0 < along < length and cross * cross <= tolerance * tolerance * length
+
+        if len(points) < 3:
+            return points
+
+        kept = [points[0]]
+        dropped = []
+        for point, after in zip(points[1:-1], points[2:]):
+            before = kept[-1]
+            forward = (
+                (point.x - before.x) * (after.x - point.x) +
+                (point.y - before.y) * (after.y - point.y)
+            )
+            # Turning back on itself is not a straight run
+            if forward > 0 and all(near(before, after, other) for other in dropped + [point]):
+                dropped.append(point)
+            else:
+                kept.append(point)
+                dropped = []
+        kept.append(points[-1])
+        return kept
 
     #------------------------------------------------------------------------
 
-    def _set_points(self, points: List[svg.Point]):
-        self.points = points[:]
+    @staticmethod
+    def drop_spikes(points: List[svg.Point], tolerance: float) -> List[svg.Point]:
+        ''' Remove the points where a closed polygon turns straight back
+        on itself. Those spikes cover no area but KiCad still draws them.
+        A point is a spike when the path reverses at it and it is within
+        tolerance of the line between its neighbors.
+        '''
+        def spike(before, point, after):
+            dx = after.x - before.x
+            dy = after.y - before.y
+            cross = (point.x - before.x) * dy - (point.y - before.y) * dx
+            forward = (
+                (point.x - before.x) * (after.x - point.x) +
+                (point.y - before.y) * (after.y - point.y)
+            )
+            return forward < 0 and cross * cross <= tolerance * tolerance * (dx * dx + dy * dy)
+
+        kept = []
+        for point in points:
+            if kept and kept[-1].x == point.x and kept[-1].y == point.y:
+                continue
+            kept.append(point)
+            while len(kept) > 2 and spike(kept[-3], kept[-2], kept[-1]):
+                del kept[-2]
+                if kept[-2].x == kept[-1].x and kept[-2].y == kept[-1].y:
+                    del kept[-1]
+
+        # The first point of a closed polygon is between the last two
+        while len(kept) > 3 and kept[0] == kept[-1] and spike(kept[-2], kept[0], kept[1]):
+            kept = kept[1:-1] + [kept[1]]
+            while len(kept) > 3 and spike(kept[-3], kept[-2], kept[-1]):
+                del kept[-2]
+        return kept
 
     #------------------------------------------------------------------------
 
-    def _find_insertion_point( self, hole: 'PolygonSegment', holes: list, other_insertions: list ):
+    def edge_grid( self ) -> EdgeGrid:
+        '''Return the spatial index of the edges of the polygon.
+        It is built on first use and kept until the points change.
+        '''
+        if self._edge_grid is None:
+            self._edge_grid = EdgeGrid( self.points, self.bbox )
+        return self._edge_grid
+
+    #------------------------------------------------------------------------
+
+    def _find_insertion_points( self, holes: List['PolygonSegment'] ) -> Tuple[list, dict]:
         ''' KiCad will not "pick up the pen" when moving between a polygon outline
         and holes within it, so we search for a pair of points connecting the
         outline (self) or other previously inserted points to the hole such
         that the connecting segment will not cross the visible inner space
         within any hole.
+
+        Each hole is connected straight down from its highest point to the
+        closest edge of the outline or of a hole connected before it. The
+        holes are connected in order and the edges of each path are added
+        to a segment tree over the x of the tops of the holes, so finding
+        the closest edge only tests the edges of the paths connected so far
+        that span the x of the hole.
+
+        New connecting points are added to splits instead of the points of
+        the polygons so the indices of the edges never change. It returns a
+        list of (point, hole, hole point) in the order the holes are
+        connected, where point is an object in the points or splits of a
+        polygon, and the splits.
         '''
 
-        highest_point = max(hole.points, key=lambda v: v.y)
-        vertical_line = LineSegment(highest_point, svg.Point(highest_point.x, self.bbox[1].y+1))
-
-        intersections = {self: self.intersects(vertical_line, False, count_intersections=True, get_points=True)}
-        for _,h,__ in other_insertions:
-            if h.bbox[0].x < highest_point.x and h.bbox[1].x > highest_point.x:
-                intersections[h] = h.intersects(vertical_line, False, count_intersections=True, get_points=True)
-
-        best = [self, intersections[self][0]]
-        best.append(LineSegment.vertical_intersection(best[1][0], best[1][1], highest_point.x))
-        for path in intersections:
-            for p,q in intersections[path]:
-                pnt = LineSegment.vertical_intersection(p, q, highest_point.x)
-                if pnt.y < best[2].y:
-                    best = [path, (p,q), pnt]
-
-        if best[2] != best[1][0] and best[2] != best[1][1]:
-            p = best[0].points.index(best[1][0])
-            p_cnt = best[0].points.count(best[1][0])
-
-            q = best[0].points.index(best[1][1])
-            q_cnt = best[0].points.count(best[1][1])
-
-            best_len = len(best[0].points)
-
-            tried = [[p],[q]]
-            # The same point can be present multiple times without being part of the
-            # desired segment. The points are also not next to each other.
-            while (
-               (p_cnt > 1 or q_cnt > 1) and
-               (p + 1)%best_len != q and
-               (p - 1)%best_len != q
-            ):
-                if len(tried[0]) < p_cnt:
-                    p = best[0].points.index(best[1][0], p+1)
-                    tried[0].append(p)
-                elif len(tried[1]) < q_cnt:
-                    p = tried[0][0]
-                    tried[0] = [p]
-                    q = best[0].points.index(best[1][1], q+1)
-                    tried[1].append(q)
-                else:
-                    logger.error("Unable to find segment for inlining.")
-                    break
+        paths = [ self ] + holes
+        tops = [ max( hole.points, key = lambda v: v.y ) for hole in holes ]
+        bottom = self.bbox[ 1 ].y + 1
+
+        # Every node holds the (path, edge) of the edges spanning the tops below it
+        xs = sorted( set( top.x for top in tops ) )
+        size = len( xs )
+        spanning = [ [] for _ in range( 2 * size ) ]
+
+        ray = LineSegment()
+        edge = LineSegment()
+        closest = [ None ] * len( holes )
+        for hole, top in enumerate( tops ):
+
+            # Only the outline and the holes connected before this one
+            path = paths[ hole ]
+            for index, ( p, q ) in enumerate( zip( path.points, path.points[ 1 : ] ) ):
+                low = bisect.bisect_left( xs, min( p.x, q.x ) ) + size
+                high = bisect.bisect_right( xs, max( p.x, q.x ) ) + size
+                while low < high:
+                    if low & 1:
+                        spanning[ low ].append( ( hole, index ) )
+                        low += 1
+                    if high & 1:
+                        high -= 1
+                        spanning[ high ].append( ( hole, index ) )
+                    low //= 2
+                    high //= 2
+
+            x = top.x
+            ray.p = top
+            ray.q = svg.Point( x, bottom )
+            node = bisect.bisect_left( xs, x ) + size
+            while node:
+                for number, index in spanning[ node ]:
+
+                    if number and not paths[ number ].bbox[ 0 ].x < x < paths[ number ].bbox[ 1 ].x:
+                        continue
+
+                    edge.p = paths[ number ].points[ index ]
+                    edge.q = paths[ number ].points[ index + 1 ]
+                    if ray.intersects( edge ):
+                        found = ( LineSegment.vertical_intersection( edge.p, edge.q, x ).y, number, index )
+                        if closest[ hole ] is None or found < closest[ hole ]:
+                            closest[ hole ] = found
+                node //= 2
+
+        splits = {}
+        insertions = []
+        for hole, top in enumerate( tops ):
+
+            if closest[ hole ] is None:
+                logger.error( "Unable to find a point to connect a hole to." )
+                continue
+
+            _, number, index = closest[ hole ]
+            path = paths[ number ]
+
+            # Find where the edge is hit again now that earlier holes may have split it
+            edge_splits = splits.setdefault( path, {} ).setdefault( index, [] )
+            points = [ path.points[ index ] ] + edge_splits + [ path.points[ index + 1 ] ]
+            ray.p = top
+            ray.q = svg.Point( top.x, bottom )
+            best = None
+            for p, q in zip( points, points[ 1 : ] ):
+                edge.p, edge.q = p, q
+                if ray.intersects( edge ):
+                    point = LineSegment.vertical_intersection( p, q, top.x )
+                    if best is None or point.y < best[ 2 ].y:
+                        best = ( p, q, point )
+            if best is None:
+                best = ( points[ 0 ], points[ -1 ], LineSegment.vertical_intersection( points[ 0 ], points[ -1 ], top.x ) )
+
+            p, q, point = best
+            if point != p and point != q:
+                # Keep the edge split in order along the edge
+                position = next( ( i + 1 for i, v in enumerate( edge_splits ) if v is p ), 0 )
+                edge_splits.insert( position, point )
+            else:
+                point = p if point == p else q
+                # The last point of a closed polygon is the first one
+                if point is path.points[ -1 ] and path.points[ 0 ] == point:
+                    point = path.points[ 0 ]
 
-            ip = p if p < q else q
-            best[0]._set_points(best[0].points[:ip+1] + [best[2]] + best[0].points[ip+1:])
+            insertions.append( ( point, holes[ hole ], top ) )
 
-        return (best[2], hole, highest_point)
+        return insertions, splits
+
+    #------------------------------------------------------------------------
+
+    def _ring( self, splits: dict, start: svg.Point ) -> List[svg.Point]:
+        ''' Return the points of the polygon with the added splits,
+        without repeating the first point, beginning with start.
+        '''
+        count = len( self.points ) - 1 if self.points[ 0 ] == self.points[ -1 ] else len( self.points )
+        nodes = []
+        for index in range( count ):
+            nodes.append( self.points[ index ] )
+            nodes.extend( splits.get( index, () ) )
+        first = next( ( i for i, node in enumerate( nodes ) if node is start ), 0 )
+        return nodes[ first : ] + nodes[ : first ]
 
     #------------------------------------------------------------------------
 
@@ -281,14 +616,11 @@ class PolygonSegment:
 
         if index > 0:
 
-            # Strip off end point, which is a duplicate of the start point:
-            points = points[ : -1 ]
-
-            points = points[ index : ] + points[ : index ]
-
-            points.append(
-                svg.Point( points[ 0 ].x, points[ 0 ].y )
-            )
+            # Leave out the end point, which is a duplicate of the start point,
+            # and close the rotated points with a copy of the new start point
+            points = points[ index : -1 ] + points[ : index ] + [
+                svg.Point( points[ index ].x, points[ index ].y )
+            ]
 
         return points
 
@@ -296,7 +628,12 @@ class PolygonSegment:
     #------------------------------------------------------------------------
 
     def inline( self, segments: List[svg.Point] ) -> List[svg.Point]:
-        ''' Return a list of points with the given polygon segments (paths) inlined. '''
+        ''' Return a list of points with the given polygon segments (paths) inlined.
+
+        The points are kept in a linked list and each hole is spliced in
+        front of the first appearance of the point it connects to, so
+        it takes time linear in the number of points.
+        '''
 
         if len( segments ) < 1:
             return self.points
@@ -305,37 +642,136 @@ class PolygonSegment:
 
         segments.sort(reverse=True, key=lambda h: h.bbox[1].y)
 
-        all_segments = segments[ : ] + [ self ]
-        insertions = []
-
         # Find the insertion point for each hole:
-        for hole in segments:
+        insertions, splits = self._find_insertion_points( segments )
 
-            insertion = self._find_insertion_point( hole, all_segments, insertions)
+        # Copies are returned to prevent them from affecting the original objects
+        points = []
+        before = []
+        after = []
+        # Position of the first appearance of each point by its id
+        first = {}
 
-            if insertion is not None:
-                insertions.append( insertion )
+        def link( nodes ):
+            head = len( points )
+            for node in nodes:
+                first.setdefault( id( node ), len( points ) )
+                points.append( copy.copy( node ) )
+                before.append( len( points ) - 2 )
+                after.append( len( points ) )
+            return head, len( points ) - 1
 
-        # Prevent returned points from affecting original object
-        points = copy.deepcopy(self.points)
+        head, tail = link( self._ring( splits.get( self, {} ), self.points[ 0 ] ) + self.points[ -1 : ] )
+        before[ head ] = -1
+        after[ tail ] = -1
 
-        for insertion in insertions:
+        for anchor, hole, start in insertions:
 
-            ip = points.index(insertion[0])
-            hole = insertion[1].points_starting_on_index(insertion[1].points.index(insertion[2]))
+            position = first[ id( anchor ) ]
+            nodes = hole._ring( splits.get( hole, {} ), start )
 
             if (
-                points[ ip ].x == hole[ 0 ].x and
-                points[ ip ].y == hole[ 0 ].y
+                points[ position ].x == nodes[ 0 ].x and
+                points[ position ].y == nodes[ 0 ].y
             ):
-                # The point at the insertion point is duplicated so any action on that will affect both
-                points = points[:ip] + [copy.copy(points[ip])] + hole[ 1 : -1 ] + points[ip:]
+                # The hole starts on the insertion point so it isn't repeated
+                nodes = nodes[ 1 : ]
+            else:
+                nodes = nodes + [ start ]
+
+            # The point at the insertion point is duplicated so any action on that will affect both
+            run_head, run_tail = link( [ anchor ] + nodes )
+            first[ id( anchor ) ] = run_head
+
+            previous = before[ position ]
+            before[ run_head ] = previous
+            after[ run_tail ] = position
+            before[ position ] = run_tail
+            if previous < 0:
+                head = run_head
             else:
-                # The point at the insertion point is duplicated so any action on that will affect both
-                points = points[:ip] + [copy.copy(points[ip])] + hole + points[ip:]
+                after[ previous ] = run_head
 
-        return points
+        inlined = []
+        position = head
+        while position >= 0:
+            inlined.append( points[ position ] )
+            position = after[ position ]
+
+        return inlined
+
+
+    #------------------------------------------------------------------------
+
+    @staticmethod
+    def find_crossing( points: List[svg.Point], resolution: float = 1e-6 ) -> svg.Point:
+        ''' Return a point where two edges of the polygon cross each
+        other, or None. Edges that only touch, like the two sides of a
+        hole's connecting line, are not crossings.
+
+        The edges are swept across x keeping the ones spanning the sweep
+        ordered from bottom to top in a SweepLine. A new edge is compared
+        to the edges next to it, and an edge removed from the sweep makes
+        its neighbors adjacent. The first crossing is always found between
+        neighbors, and every event takes O(log n) steps on average, so it
+        takes O(n log n) steps.
+        '''
+
+        steps = max( 1, int( round( 1 / resolution ) ) )
+        ring = [ ( int( round( p.x * steps ) ), int( round( p.y * steps ) ) ) for p in points ]
+        if ring and ring[ 0 ] != ring[ -1 ]:
+            ring.append( ring[ 0 ] )
+
+        # Edges go from their lowest (x, y) to their highest
+        edges = [ ( min( p, q ), max( p, q ) ) for p, q in zip( ring, ring[ 1 : ] ) if p != q ]
+
+        def orientation( p, q, r ):
+            return ( q[ 0 ] - p[ 0 ] ) * ( r[ 1 ] - p[ 1 ] ) - ( q[ 1 ] - p[ 1 ] ) * ( r[ 0 ] - p[ 0 ] )
+
+        def crossing( a, b ):
+            ( p, q ), ( r, s ) = edges[ a ], edges[ b ]
+            d1 = orientation( p, q, r )
+            d2 = orientation( p, q, s )
+            d3 = orientation( r, s, p )
+            d4 = orientation( r, s, q )
+            if d1 * d2 >= 0 or d3 * d4 >= 0:
+                return None
+            t = d3 / ( d3 - d4 )
+            return svg.Point(
+                ( p[ 0 ] + ( q[ 0 ] - p[ 0 ] ) * t ) / steps,
+                ( p[ 1 ] + ( q[ 1 ] - p[ 1 ] ) * t ) / steps,
+            )
+
+        def above( a, b ):
+            # Is the new edge a above edge b where a starts?
+            p, q = edges[ b ]
+            side = orientation( p, q, edges[ a ][ 0 ] ) or orientation( p, q, edges[ a ][ 1 ] )
+            return side > 0 if side else a > b
 
+        # Edges leave the sweep before others enter at the same point
+        events = sorted(
+            [ ( edge[ 0 ], 1, index ) for index, edge in enumerate( edges ) ] +
+            [ ( edge[ 1 ], 0, index ) for index, edge in enumerate( edges ) ]
+        )
+
+        active = SweepLine( len( edges ), above )
+        for _, entering, index in events:
+
+            if entering:
+                active.add( index )
+                neighbors = [ ( active.neighbor_below( index ), index ), ( index, active.neighbor_above( index ) ) ]
+            else:
+                neighbors = [ ( active.neighbor_below( index ), active.neighbor_above( index ) ) ]
+                active.remove( index )
+
+            for a, b in neighbors:
+                if a is None or b is None:
+                    continue
+                point = crossing( a, b )
+                if point is not None:
+                    return point
+
+        return None
 
     #------------------------------------------------------------------------
 
@@ -360,47 +796,48 @@ class PolygonSegment:
         intersect_segments = []
         virtual_line = LineSegment()
 
-        # Check each segment of other hole for intersection:
-        for point in self.points:
+        # Check each segment of other hole that is near the line for intersection.
+        # Edges that are skipped can't intersect so the result is the same as
+        # checking all of them in order.
+        for index in self.edge_grid().query( line_segment.p, line_segment.q ):
 
-            hole_segment.q_next( point )
+            hole_segment.p = self.points[ index ]
+            hole_segment.q = self.points[ index + 1 ]
 
-            if hole_segment.p is not None:
+            if ( check_connects and line_segment.connects( hole_segment )):
+                continue
 
-                if ( check_connects and line_segment.connects( hole_segment )):
-                    continue
+            if line_segment.intersects( hole_segment ):
 
-                if line_segment.intersects( hole_segment ):
+                if count_intersections:
+                    if get_points:
+                        intersect_segments.append((hole_segment.p, hole_segment.q))
+                    else:
+                        # If a point is on the line segment we need to see if the
+                        # simplified "virtual" line crosses the line segment.
+
+                        # Set the endpoints if they are of the line segment
+                        if line_segment.on_line(hole_segment.q):
+                            if not line_segment.on_line(hole_segment.p):
+                                virtual_line.p = hole_segment.p
+                        elif line_segment.on_line(hole_segment.p):
+                            virtual_line.q = hole_segment.q
 
-                    if count_intersections:
-                        if get_points:
-                            intersect_segments.append((hole_segment.p, hole_segment.q))
+                        # No points are on the line segment
                         else:
-                            # If a point is on the line segment we need to see if the
-                            # simplified "virtual" line crosses the line segment.
-
-                            # Set the endpoints if they are of the line segment
-                            if line_segment.on_line(hole_segment.q):
-                                if not line_segment.on_line(hole_segment.p):
-                                    virtual_line.p = hole_segment.p
-                            elif line_segment.on_line(hole_segment.p):
-                                virtual_line.q = hole_segment.q
-
-                            # No points are on the line segment
-                            else:
-                                intersections += 1
-                                virtual_line = LineSegment()
+                            intersections += 1
+                            virtual_line = LineSegment()
 
-                            # The virtual line is complete check for intersections
-                            if virtual_line.p and virtual_line.q:
-                                if virtual_line.intersects(line_segment):
-                                    intersections += 1
-                                virtual_line = LineSegment()
+                        # The virtual line is complete check for intersections
+                        if virtual_line.p and virtual_line.q:
+                            if virtual_line.intersects(line_segment):
+                                intersections += 1
+                            virtual_line = LineSegment()
 
-                    elif get_points:
-                        return hole_segment.p, hole_segment.q
-                    else:
-                        return True
+                elif get_points:
+                    return hole_segment.p, hole_segment.q
+                else:
+                    return True
 
         if count_intersections:
             return intersect_segments if get_points else intersections
@@ -414,19 +851,12 @@ class PolygonSegment:
     def process( self, transformer, flip, fill ):
         ''' Apply all transformations, then remove duplicate
         consecutive points along the path.
+        Points that only became the same after snapping to the output
+        resolution are removed too, as are points less than half a
+        step from the straight line past them.
         '''
 
-        points = []
-        for point in self.points:
-
-            point = transformer.transform_point( point, flip )
-
-            if (
-                len( points ) < 1 or
-                point.x != points[ -1 ].x or
-                point.y != points[ -1 ].y
-            ):
-                points.append( point )
+        points = transformer.transform_points( self.points, flip )
 
         if (
             points[ 0 ].x != points[ -1 ].x or
@@ -439,45 +869,667 @@ class PolygonSegment:
                     points[ 0 ].y,
                 ) )
 
-        self.points = points
-        self.calc_bbox()
+        self._set_points( points, transformer.resolution / 2 )
 
 
     #------------------------------------------------------------------------
 
     def calc_bbox(self) -> Tuple[svg.Point, svg.Point]:
         '''Calculate bounding box of self'''
+        xs = [point.x for point in self.points]
+        ys = [point.y for point in self.points]
         self.bbox =  (
-            svg.Point(min(self.points, key=lambda v: v.x).x, min(self.points, key=lambda v: v.y).y),
-            svg.Point(max(self.points, key=lambda v: v.x).x, max(self.points, key=lambda v: v.y).y),
+            svg.Point(min(xs), min(ys)),
+            svg.Point(max(xs), max(ys)),
         )
 
     #------------------------------------------------------------------------
 
+    def contains(self, polygon: 'PolygonSegment') -> bool:
+        ''' Checks if the supplied polygon is inside of this polygon.
+        Its bounding box has to be strictly inside of ours and its
+        first point inside of our outline.
+        '''
+        if not (
+            self.bbox[0].x < polygon.bbox[0].x and
+            self.bbox[0].y < polygon.bbox[0].y and
+            self.bbox[1].x > polygon.bbox[1].x and
+            self.bbox[1].y > polygon.bbox[1].y
+        ):
+            return False
+
+        # An odd number of crossings means the smaller polygon is contained
+        return bool(self.crossings(polygon.points[0]) % 2)
+
+    #------------------------------------------------------------------------
+
+    def _edges( self ):
+        ''' Yield the edges of the closed outline '''
+        points = self.points
+        for index in range( len( points ) - 1 ):
+            yield points[ index ], points[ index + 1 ]
+        if points[ 0 ] != points[ -1 ]:
+            yield points[ -1 ], points[ 0 ]
+
+    #------------------------------------------------------------------------
+
+    def _row_edges( self, y: float ) -> list:
+        ''' Return the edges that may cross the horizontal line at y '''
+        points = self.points
+        grid = self.edge_grid()
+        edges = [
+            ( points[ index ], points[ index + 1 ] ) for index in grid.query(
+                svg.Point( self.bbox[ 0 ].x, y ), svg.Point( self.bbox[ 1 ].x, y )
+            )
+        ]
+        # The closing edge isn't in the grid if the outline is open
+        if points[ 0 ] != points[ -1 ]:
+            edges.append( ( points[ -1 ], points[ 0 ] ) )
+        return edges
+
+    #------------------------------------------------------------------------
+
+    @staticmethod
+    def _winding( edges, point: svg.Point ) -> Tuple[int, int]:
+        ''' Return the winding number and the number of crossings of the
+        edges around point, counting the edges that cross the horizontal
+        ray to the right of the point.
+
+        Edges are treated as half open in y (the lower end is included and
+        the upper end is not) so a ray passing through a vertex counts
+        exactly one of the two edges meeting there and horizontal edges are
+        never counted. There are no special cases for degenerate input.
+        '''
+        winding = 0
+        crossings = 0
+        x, y = point.x, point.y
+        for p, q in edges:
+            if ( p.y <= y ) == ( q.y <= y ):
+                continue
+            # Which side of the edge the point is on
+            side = ( q.x - p.x ) * ( y - p.y ) - ( x - p.x ) * ( q.y - p.y )
+            if q.y > p.y and side > 0:
+                winding += 1
+                crossings += 1
+            elif q.y < p.y and side < 0:
+                winding -= 1
+                crossings += 1
+        return winding, crossings
+
+    #------------------------------------------------------------------------
+
+    def winding_number( self, point: svg.Point ) -> int:
+        ''' Return how many times the outline winds around point.
+        It is 0 if the point is outside of the outline.
+        '''
+        return self._winding( self._row_edges( point.y ), point )[ 0 ]
+
+    #------------------------------------------------------------------------
+
+    def crossings( self, point: svg.Point ) -> int:
+        ''' Return how many times a ray from point crosses the outline.
+        It is odd if the point is inside with the even-odd fill rule.
+        '''
+        return self._winding( self._row_edges( point.y ), point )[ 1 ]
+
+    #------------------------------------------------------------------------
+
+    def contains_points( self, points: List[svg.Point], nonzero: bool = False ) -> List[bool]:
+        ''' Test many points at once. Returns if each point is inside
+        of the outline with the even-odd or the nonzero fill rule.
+        The edges near each horizontal line are only looked up once
+        for all points with the same y.
+        '''
+        rows = {}
+        inside = []
+        for point in points:
+            edges = rows.get( point.y )
+            if edges is None:
+                edges = rows[ point.y ] = self._row_edges( point.y )
+            winding, crossings = self._winding( edges, point )
+            inside.append( winding != 0 if nonzero else bool( crossings % 2 ) )
+        return inside
+
+    #------------------------------------------------------------------------
+
     def are_distinct(self, polygon):
         ''' Checks if the supplied polygon either contains or insets our bounding box'''
-        distinct = True
 
         smaller = min([self, polygon], key=lambda p: svg.Segment(p.bbox[0], p.bbox[1]).length())
         larger = self if smaller == polygon else polygon
 
-        if (
-            larger.bbox[0].x < smaller.bbox[0].x and
-            larger.bbox[0].y < smaller.bbox[0].y and
-            larger.bbox[1].x > smaller.bbox[1].x and
-            larger.bbox[1].y > smaller.bbox[1].y
-        ):
-            distinct = False
+        return not larger.contains(smaller)
 
-        # Check number of horizontal intersections. If the number is odd then it the smaller polygon
-        # is contained. If the number is even then the polygon is outside of the larger polygon
-        if not distinct:
-            test_line = LineSegment(smaller.points[0], svg.Point(larger.bbox[1].x+1, smaller.points[0].y))
-            distinct = bool((larger.intersects(test_line, False, True) + 1)%2)
+    #------------------------------------------------------------------------
+
+    @staticmethod
+    def nest( polygons: List['PolygonSegment'] ) -> List[Tuple['PolygonSegment', List['PolygonSegment']]]:
+        ''' Sort the polygons into outlines and the holes directly inside of them.
+        Polygons nested an even number of levels deep are outlines and the
+        ones an odd number of levels deep are holes of the polygon around them,
+        so islands inside of holes become outlines of their own.
+
+        Returns a list of (outline, holes) with the largest outlines first,
+        the holes can be passed straight to inline().
+
+        Parents are found with a grid of the polygon bounding boxes so each
+        polygon is only tested against the polygons whose bounding box
+        covers its first point.
+        '''
+        polygons = sorted(
+            polygons, reverse = True,
+            key = lambda v: svg.Segment( v.bbox[ 0 ], v.bbox[ 1 ] ).length()
+        )
+        if len( polygons ) < 2:
+            return [ ( polygon, [] ) for polygon in polygons ]
+
+        min_x = min( p.bbox[ 0 ].x for p in polygons )
+        min_y = min( p.bbox[ 0 ].y for p in polygons )
+        size = max( 1, int( math.sqrt( len( polygons ) ) ) )
+        cell_w = ( max( p.bbox[ 1 ].x for p in polygons ) - min_x ) / size or 1
+        cell_h = ( max( p.bbox[ 1 ].y for p in polygons ) - min_y ) / size or 1
+
+        def cell( value, origin, step ):
+            return min( max( int( ( value - origin ) // step ), 0 ), size - 1 )
+
+        grid = {}
+        depth = {}
+        holes = {}
+        tree = []
+        for polygon in polygons:
+
+            # Bigger polygons come first so all possible parents are in the grid
+            point = polygon.points[ 0 ]
+            parent = None
+            for candidate in grid.get( ( cell( point.x, min_x, cell_w ), cell( point.y, min_y, cell_h ) ), () ):
+                if candidate.contains( polygon ):
+                    # The innermost container is the last one added
+                    parent = candidate
+
+            depth[ polygon ] = 0 if parent is None else depth[ parent ] + 1
+            if depth[ polygon ] % 2:
+                holes[ parent ].append( polygon )
+            else:
+                holes[ polygon ] = []
+                tree.append( ( polygon, holes[ polygon ] ) )
+
+            for col in range( cell( polygon.bbox[ 0 ].x, min_x, cell_w ), cell( polygon.bbox[ 1 ].x, min_x, cell_w ) + 1 ):
+                for row in range( cell( polygon.bbox[ 0 ].y, min_y, cell_h ), cell( polygon.bbox[ 1 ].y, min_y, cell_h ) + 1 ):
+                    grid.setdefault( ( col, row ), [] ).append( polygon )
+
+        return tree
 
-        return distinct
     #------------------------------------------------------------------------
 
 
 #----------------------------------------------------------------------------
 
+class PolygonUnion:
+    ''' Boolean union of filled shapes.
+
+    Every shape is added with the fill rule of the svg element it came
+    from. The union is rebuilt from the edges with the inside of the
+    union on one side only, after all edges are split where they cross
+    and coincident edges are merged. Overlapping shapes and shapes
+    sharing an edge become a single outline.
+
+    Coordinates are snapped to integer multiples of resolution so all
+    the crossing and winding tests are exact. With a resolution of 1 the
+    union has integer coordinates like the input of the legacy format.
+    '''
+
+    resolution = 1e-6
+    max_split_passes = 8
+
+    #------------------------------------------------------------------------
+
+    def __init__( self, resolution: float = None ):
+        if resolution is not None:
+            self.resolution = resolution
+        self._steps = max( 1, int( round( 1 / self.resolution ) ) )
+        self.rings = []
+        self.shapes = 0
+        self._tree = None
+
+    #------------------------------------------------------------------------
+
+    def add( self, polygons: List[PolygonSegment], fill_rule: str = None ):
+        ''' Add the polygons of a shape. fill_rule is "nonzero" or "evenodd".
+        Without a fill rule polygons nested an odd number of levels deep
+        are holes, the same as PolygonSegment.nest().
+        '''
+        polygons = [ polygon for polygon in polygons if len( polygon.points ) > 2 ]
+        if fill_rule in ( "nonzero", "evenodd" ):
+            self._tree = None
+            rings = self._resolve(
+                [ self._ring( polygon.points ) for polygon in polygons ],
+                fill_rule == "evenodd"
+            )
+            # These rings don't overlap each other anymore
+            self.rings.extend( ( ring, self.shapes ) for ring in rings )
+        else:
+            self._tree = PolygonSegment.nest( polygons )
+            for outline, holes in self._tree:
+                self.rings.append( ( self._oriented( self._ring( outline.points ), True ), None ) )
+                self.rings.extend( ( self._oriented( self._ring( hole.points ), False ), None ) for hole in holes )
+        self.shapes += 1
+
+    #------------------------------------------------------------------------
+
+    def nest( self ) -> List[Tuple[PolygonSegment, List[PolygonSegment]]]:
+        ''' Return the union as a list of (outline, holes) like PolygonSegment.nest() '''
+
+        # A single shape without a fill rule is left the way svg2mod always drew it
+        if self.shapes == 1 and self._tree is not None:
+            return self._tree
+
+        rings = [ ring for ring, _ in self.rings ]
+        tree = []
+        for cluster in self._clusters( rings ):
+            shapes = { self.rings[ index ][ 1 ] for index in cluster }
+            cluster = [ rings[ index ] for index in cluster ]
+            # Rings of a single shape that was already resolved can't overlap
+            if len( shapes ) > 1 or None in shapes:
+                cluster = self._resolve( cluster, False )
+            tree.extend( self._assemble( cluster ) )
+
+        tree.sort( reverse = True, key = lambda v: svg.Segment( v[ 0 ].bbox[ 0 ], v[ 0 ].bbox[ 1 ] ).length() )
+        return tree
+
+    #------------------------------------------------------------------------
+
+    def _assemble( self, rings ) -> List[Tuple[PolygonSegment, List[PolygonSegment]]]:
+        ''' Turn resolved rings into (outline, holes). Counter clockwise
+        rings are outlines and each hole belongs to the smallest outline
+        around it.
+        '''
+        outlines = []
+        holes = []
+        for ring in rings:
+            points = []
+            for x, y in ring + ring[ : 1 ]:
+                if self._steps == 1:
+                    # Integers like transform_point() gives the legacy format
+                    point = svg.Point( 0, 0 )
+                    point.x, point.y = x, y
+                else:
+                    point = svg.Point( x / self._steps, y / self._steps )
+                points.append( point )
+            polygon = PolygonSegment( points )
+            if self._area( ring ) > 0:
+                outlines.append( ( self._area( ring ), polygon ) )
+            else:
+                holes.append( polygon )
+
+        outlines.sort( key = lambda v: v[ 0 ] )
+        tree = { outline: [] for _, outline in outlines }
+        for hole in holes:
+            # The middle of an edge can't be on an outline, a vertex can
+            p, q = hole.points[ 0 ], hole.points[ 1 ]
+            point = svg.Point( ( p.x + q.x ) / 2, ( p.y + q.y ) / 2 )
+            for _, outline in outlines:
+                if (
+                    outline.bbox[ 0 ].x <= hole.bbox[ 0 ].x and hole.bbox[ 1 ].x <= outline.bbox[ 1 ].x and
+                    outline.bbox[ 0 ].y <= hole.bbox[ 0 ].y and hole.bbox[ 1 ].y <= outline.bbox[ 1 ].y and
+                    outline.crossings( point ) % 2
+                ):
+                    tree[ outline ].append( hole )
+                    break
+            else:
+                logger.debug( "  Dropping a hole outside of every outline" )
+
+        return [ ( outline, tree[ outline ] ) for _, outline in outlines ]
+
+    #------------------------------------------------------------------------
+
+    def _ring( self, points: List[svg.Point] ) -> List[Tuple[int, int]]:
+        ''' Snap the points to the grid and drop repeated points '''
+        ring = []
+        for point in points:
+            vertex = ( int( round( point.x * self._steps ) ), int( round( point.y * self._steps ) ) )
+            if not ring or ring[ -1 ] != vertex:
+                ring.append( vertex )
+        while len( ring ) > 1 and ring[ 0 ] == ring[ -1 ]:
+            ring.pop()
+        return ring
+
+    #------------------------------------------------------------------------
+
+    @staticmethod
+    def _area( ring ) -> int:
+        ''' Twice the signed area of the ring, positive if counter clockwise '''
+        return sum(
+            ring[ i - 1 ][ 0 ] * ring[ i ][ 1 ] - ring[ i ][ 0 ] * ring[ i - 1 ][ 1 ]
+            for i in range( len( ring ) )
+        )
+
+    #------------------------------------------------------------------------
+
+    @classmethod
+    def _oriented( cls, ring, counter_clockwise: bool ):
+        if ( cls._area( ring ) > 0 ) != counter_clockwise:
+            ring.reverse()
+        return ring
+
+    #------------------------------------------------------------------------
+
+    @classmethod
+    def _resolve( cls, rings, even_odd: bool ):
+        ''' Return the boundary of the area covered by the rings as
+        counter clockwise outlines and clockwise holes.
+        Rings with overlapping bounding boxes are resolved together.
+        '''
+        rings = [ ring for ring in rings if len( ring ) > 2 ]
+        result = []
+        for cluster in cls._clusters( rings ):
+            edges = cls._merge( cls._split( [ rings[ index ] for index in cluster ] ) )
+            result.extend( cls._link( cls._boundary( edges, even_odd ) ) )
+        return result
+
+    #------------------------------------------------------------------------
+
+    @staticmethod
+    def _clusters( rings ) -> List[List[int]]:
+        ''' Group the indices of the rings with overlapping bounding boxes '''
+
+        boxes = []
+        for index, ring in enumerate( rings ):
+            xs = [ x for x, _ in ring ]
+            ys = [ y for _, y in ring ]
+            boxes.append( ( min( xs ), max( xs ), min( ys ), max( ys ), index ) )
+        boxes.sort()
+
+        parent = list( range( len( rings ) ) )
+        def find( index ):
+            while parent[ index ] != index:
+                parent[ index ] = parent[ parent[ index ] ]
+                index = parent[ index ]
+            return index
+
+        # Sweep along x keeping the boxes that are still open
+        active = []
+        for box in boxes:
+            active = [ other for other in active if other[ 1 ] >= box[ 0 ] ]
+            for other in active:
+                if other[ 2 ] <= box[ 3 ] and box[ 2 ] <= other[ 3 ]:
+                    parent[ find( box[ 4 ] ) ] = find( other[ 4 ] )
+            active.append( box )
+
+        clusters = {}
+        for index in range( len( rings ) ):
+            clusters.setdefault( find( index ), [] ).append( index )
+        return list( clusters.values() )
+
+    #------------------------------------------------------------------------
+
+    @staticmethod
+    def _intersections( a, b ):
+        ''' Return the points where the segments a and b touch '''
+
+        ( x1, y1 ), ( x2, y2 ) = a
+        ( x3, y3 ), ( x4, y4 ) = b
+        dx1, dy1 = x2 - x1, y2 - y1
+        dx2, dy2 = x4 - x3, y4 - y3
+        denominator = dx1 * dy2 - dy1 * dx2
+
+        if denominator == 0:
+            if ( x3 - x1 ) * dy1 - ( y3 - y1 ) * dx1 != 0:
+                return ()
+            # Collinear, the ends of each segment inside of the other split it
+            def within( point, p, q ):
+                return (
+                    min( p[ 0 ], q[ 0 ] ) <= point[ 0 ] <= max( p[ 0 ], q[ 0 ] ) and
+                    min( p[ 1 ], q[ 1 ] ) <= point[ 1 ] <= max( p[ 1 ], q[ 1 ] )
+                )
+            return [ point for point in a if within( point, *b ) ] + [ point for point in b if within( point, *a ) ]
+
+        t = ( x3 - x1 ) * dy2 - ( y3 - y1 ) * dx2
+        u = ( x3 - x1 ) * dy1 - ( y3 - y1 ) * dx1
+        if denominator < 0:
+            denominator, t, u = -denominator, -t, -u
+        if not ( 0 <= t <= denominator and 0 <= u <= denominator ):
+            return ()
+        return [ (
+            x1 + int( round( dx1 * t / denominator ) ),
+            y1 + int( round( dy1 * t / denominator ) ),
+        ) ]
+
+    #------------------------------------------------------------------------
+
+    @classmethod
+    def _split( cls, rings ):
+        ''' Return the edges of the rings split at every crossing.
+
+        Crossings are rounded to the grid, which can move the pieces of
+        an edge across another edge, so edges are split again until
+        nothing changes.
+        '''
+        segments = [
+            ( ring[ i - 1 ], ring[ i ] )
+            for ring in rings for i in range( len( ring ) ) if ring[ i - 1 ] != ring[ i ]
+        ]
+        for _ in range( cls.max_split_passes ):
+            edges = cls._split_once( segments )
+            if len( edges ) == len( segments ):
+                break
+            segments = edges
+        else:
+            logger.debug( "  Edges still cross after {} passes".format( cls.max_split_passes ) )
+        return segments
+
+    #------------------------------------------------------------------------
+
+    @classmethod
+    def _split_once( cls, segments ):
+        ''' Return the segments split at every crossing.
+        Pairs of segments to test are found with a uniform grid.
+        '''
+        xs = [ p[ 0 ] for p, _ in segments ] + [ q[ 0 ] for _, q in segments ]
+        ys = [ p[ 1 ] for p, _ in segments ] + [ q[ 1 ] for _, q in segments ]
+        min_x = min( xs )
+        min_y = min( ys )
+        size = max( 1, int( math.sqrt( len( segments ) ) ) )
+        cell_w = ( max( xs ) - min_x ) // size + 1
+        cell_h = ( max( ys ) - min_y ) // size + 1
+
+        cells = {}
+        spans = []
+        for index, ( p, q ) in enumerate( segments ):
+            x0, x1 = ( p[ 0 ], q[ 0 ] ) if p[ 0 ] < q[ 0 ] else ( q[ 0 ], p[ 0 ] )
+            y0, y1 = ( p[ 1 ], q[ 1 ] ) if p[ 1 ] < q[ 1 ] else ( q[ 1 ], p[ 1 ] )
+            span = (
+                ( x0 - min_x ) // cell_w, ( x1 - min_x ) // cell_w,
+                ( y0 - min_y ) // cell_h, ( y1 - min_y ) // cell_h,
+            )
+            spans.append( span )
+            for col in range( span[ 0 ], span[ 1 ] + 1 ):
+                for row in range( span[ 2 ], span[ 3 ] + 1 ):
+                    cells.setdefault( ( col, row ), [] ).append( index )
+
+        splits = [ [] for _ in segments ]
+        for ( col, row ), indices in cells.items():
+            for n, i in enumerate( indices ):
+                for j in indices[ n + 1 : ]:
+                    # Each pair is only tested in the first cell they share
+                    if (
+                        max( spans[ i ][ 0 ], spans[ j ][ 0 ] ) != col or
+                        max( spans[ i ][ 2 ], spans[ j ][ 2 ] ) != row
+                    ):
+                        continue
+                    for point in cls._intersections( segments[ i ], segments[ j ] ):
+                        for k in ( i, j ):
+                            if point not in segments[ k ]:
+                                splits[ k ].append( point )
+
+        edges = []
+        for ( p, q ), points in zip( segments, splits ):
+            start = p
+            for point in sorted( set( points ), key = lambda v, p=p: abs( v[ 0 ] - p[ 0 ] ) + abs( v[ 1 ] - p[ 1 ] ) ):
+                edges.append( ( start, point ) )
+                start = point
+            edges.append( ( start, q ) )
+        return edges
+
+    #------------------------------------------------------------------------
+
+    @staticmethod
+    def _merge( edges ):
+        ''' Merge coincident edges into {(start, end): weight}.
+        Edges are stored pointing up, or left if they are horizontal,
+        and the weight is how many more of them pointed that way
+        than the other way.
+        '''
+        merged = {}
+        for p, q in edges:
+            if p[ 1 ] < q[ 1 ] or ( p[ 1 ] == q[ 1 ] and p[ 0 ] > q[ 0 ] ):
+                merged[ ( p, q ) ] = merged.get( ( p, q ), 0 ) + 1
+            else:
+                merged[ ( q, p ) ] = merged.get( ( q, p ), 0 ) - 1
+        return { edge: weight for edge, weight in merged.items() if weight }
+
+    #------------------------------------------------------------------------
+
+    @staticmethod
+    def _boundary( edges, even_odd: bool ):
+        ''' Return the edges with the inside on one side only,
+        pointing so the inside is on their left.
+
+        The winding number right of an edge is counted along a ray from
+        its middle to the right with the same half open rules as
+        PolygonSegment.winding_number(). For a horizontal edge the ray
+        counts the side above it, which is its right side as stored.
+        The winding number on the left differs by the weight of the edge.
+
+        Nothing changes sides at a vertex with only two edges, so one
+        ray is cast for each chain of edges between the vertices where
+        more edges meet and the winding numbers are carried along it.
+        '''
+        if not edges:
+            return []
+
+        def inside( winding ):
+            return bool( winding % 2 ) if even_odd else winding != 0
+
+        # Horizontal edges never cross a ray, the rest are put in bands by y
+        crossing = [ ( s, e, w ) for ( s, e ), w in edges.items() if s[ 1 ] != e[ 1 ] ]
+        min_y = min( s[ 1 ] for s, _ in edges )
+        bands = max( 1, int( math.sqrt( len( crossing ) ) ) )
+        band_h = ( max( e[ 1 ] for _, e in edges ) - min_y ) // bands + 1
+        index = {}
+        for edge in crossing:
+            for band in range( ( edge[ 0 ][ 1 ] - min_y ) // band_h, ( edge[ 1 ][ 1 ] - min_y ) // band_h + 1 ):
+                index.setdefault( band, [] ).append( edge )
+
+        def right_of( s, e ):
+            # Twice the middle of the edge so everything stays an integer
+            mx, my = s[ 0 ] + e[ 0 ], s[ 1 ] + e[ 1 ]
+            winding = 0
+            for p, q, w in index.get( ( my // 2 - min_y ) // band_h, () ):
+                if (
+                    2 * p[ 1 ] <= my < 2 * q[ 1 ] and
+                    ( q[ 0 ] - p[ 0 ] ) * ( my - 2 * p[ 1 ] ) - ( mx - 2 * p[ 0 ] ) * ( q[ 1 ] - p[ 1 ] ) > 0
+                ):
+                    winding += w
+            return winding
+
+        joined = {}
+        for edge in edges:
+            for vertex in edge:
+                joined.setdefault( vertex, [] ).append( edge )
+
+        right = {}
+        for edge in edges:
+            if edge in right:
+                continue
+            right[ edge ] = right_of( *edge )
+            # The windings left and right of the chain going the way this edge is stored
+            sides = ( right[ edge ] + edges[ edge ], right[ edge ] )
+            for vertex, forward in ( ( edge[ 1 ], True ), ( edge[ 0 ], False ) ):
+                current = edge
+                while len( joined[ vertex ] ) == 2:
+                    current = joined[ vertex ][ joined[ vertex ][ 0 ] == current ]
+                    if current in right:
+                        break
+                    # Stored the same way as the chain if it leaves the vertex going forward
+                    same = ( current[ 0 ] == vertex ) == forward
+                    right[ current ] = sides[ 1 ] if same else sides[ 0 ]
+                    vertex = current[ 1 ] if current[ 0 ] == vertex else current[ 0 ]
+
+        boundary = []
+        for edge, weight in edges.items():
+            if inside( right[ edge ] + weight ) != inside( right[ edge ] ):
+                boundary.append( edge if inside( right[ edge ] + weight ) else ( edge[ 1 ], edge[ 0 ] ) )
+        return boundary
+
+    #------------------------------------------------------------------------
+
+    @staticmethod
+    def _link( boundary ):
+        ''' Link the directed boundary edges into rings.
+        Where there is more than one way out of a vertex the sharpest
+        left turn among the edges not used yet is taken, so shapes
+        touching at a point stay separate rings. When the walk comes
+        back to a vertex it already passed the loop since then is
+        split off as a ring of its own.
+        '''
+        outgoing = {}
+        for p, q in boundary:
+            outgoing.setdefault( p, [] ).append( q )
+
+        def turn( previous, vertex, target ):
+            back = math.atan2( previous[ 1 ] - vertex[ 1 ], previous[ 0 ] - vertex[ 0 ] )
+            angle = ( back - math.atan2( target[ 1 ] - vertex[ 1 ], target[ 0 ] - vertex[ 0 ] ) ) % ( 2 * math.pi )
+            return angle if angle > 0 else 2 * math.pi
+
+        rings = []
+
+        def add( ring ):
+            # Points left in the middle of straight edges by the splits aren't needed
+            ring = [
+                vertex for i, vertex in enumerate( ring )
+                if ( vertex[ 0 ] - ring[ i - 1 ][ 0 ] ) * ( ring[ ( i + 1 ) % len( ring ) ][ 1 ] - vertex[ 1 ] ) !=
+                ( vertex[ 1 ] - ring[ i - 1 ][ 1 ] ) * ( ring[ ( i + 1 ) % len( ring ) ][ 0 ] - vertex[ 0 ] )
+            ]
+            if len( ring ) < 3:
+                return
+            # Slivers no wider than a grid step are left by rounding the crossings
+            longest = max(
+                ( p[ 0 ] - q[ 0 ] ) ** 2 + ( p[ 1 ] - q[ 1 ] ) ** 2 for p, q in zip( ring, ring[ 1 : ] + ring[ : 1 ] )
+            )
+            # Twice the area over the longest edge is the width of the ring
+            area = PolygonUnion._area( ring )
+            if area * area <= longest:
+                logger.debug( "  Dropping a ring thinner than the resolution" )
+                return
+            rings.append( ring )
+
+        for start, target in boundary:
+            if target not in outgoing[ start ]:
+                continue
+            outgoing[ start ].remove( target )
+
+            # The vertices walked so far and where each one is in the walk
+            path = [ start ]
+            position = { start: 0 }
+            previous, vertex = start, target
+            while True:
+                if vertex in position:
+                    loop = path[ position[ vertex ] : ]
+                    del path[ position[ vertex ] : ]
+                    for point in loop:
+                        del position[ point ]
+                    add( loop )
+                    if not path:
+                        break
+
+                position[ vertex ] = len( path )
+                path.append( vertex )
+                if not outgoing.get( vertex ):
+                    logger.debug( "  Dropping a boundary that doesn't close" )
+                    break
+                target = min( outgoing[ vertex ], key = lambda v, p=previous, c=vertex: turn( p, c, v ) )
+                outgoing[ vertex ].remove( target )
+                previous, vertex = vertex, target
+        return rings
+
+#----------------------------------------------------------------------------
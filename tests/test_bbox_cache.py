@@ -0,0 +1,49 @@
+'''
+Tests for clearing the cached bounding boxes of every group holding an item.
+'''
+
+import xml.etree.ElementTree as etree
+
+from svg2mod import svg
+
+#----------------------------------------------------------------------------
+
+def _rect( x ):
+    rect = svg.Rect( etree.fromstring( '<rect x="{}" y="0" width="1" height="1"/>'.format( x ) ) )
+    rect.transform()
+    return rect
+
+
+def _bbox( item ):
+    low, high = item.bbox()
+    return ( low.x, low.y, high.x, high.y )
+
+#----------------------------------------------------------------------------
+
+def test_every_owner_is_invalidated():
+    rect = _rect( 0 )
+    first, second = svg.Group(), svg.Group()
+    first.items.append( rect )
+    # The same item is put into a second group like --force-layer does
+    second.items = first.items[ : ]
+    assert _bbox( first ) == _bbox( second ) == ( 0, 0, 1, 1 )
+
+    rect.transform( svg.Matrix( [ 1, 0, 0, 1, 5, 0 ] ) )
+    assert _bbox( first ) == _bbox( second ) == ( 5, 0, 6, 1 )
+
+
+def test_nested_owners_are_invalidated():
+    rect = _rect( 0 )
+    inner, outer, layer = svg.Group(), svg.Group(), svg.Group()
+    inner.items.append( rect )
+    outer.items.append( inner )
+    layer.items.append( rect )
+    assert _bbox( outer ) == _bbox( layer ) == ( 0, 0, 1, 1 )
+
+    inner.items.append( _rect( 3 ) )
+    assert _bbox( outer ) == ( 0, 0, 4, 1 )
+    rect.transform( svg.Matrix( [ 1, 0, 0, 1, 0, 2 ] ) )
+    assert _bbox( outer ) == ( 0, 0, 4, 3 )
+    assert _bbox( layer ) == ( 0, 2, 1, 3 )
+
+#----------------------------------------------------------------------------
@@ -0,0 +1,63 @@
+'''
+Known answer tests for clipping flattened segments to convex clip paths.
+'''
+
+import pytest
+
+from svg2mod.svg import Point
+from svg2mod.svg.geometry import clip_polygon, clip_polyline, is_convex, signed_area
+
+#----------------------------------------------------------------------------
+
+SQUARE = [ Point( 0, 0 ), Point( 2, 0 ), Point( 2, 2 ), Point( 0, 2 ) ]
+
+
+def _points( points ):
+    return [ ( p.x, p.y ) for p in points ]
+
+#----------------------------------------------------------------------------
+
+def test_is_convex():
+    assert is_convex( SQUARE )
+    assert is_convex( SQUARE + SQUARE[ : 1 ] )
+    assert not is_convex( [ Point( 0, 0 ), Point( 2, 0 ), Point( 1, 1 ), Point( 2, 2 ), Point( 0, 2 ) ] )
+    assert not is_convex( SQUARE[ : 2 ] )
+
+
+def test_clip_overlapping_squares():
+    square = [ Point( 1, 1 ), Point( 3, 1 ), Point( 3, 3 ), Point( 1, 3 ) ]
+    clipped = clip_polygon( square, SQUARE )
+    assert sorted( _points( clipped ) ) == [ ( 1, 1 ), ( 1, 2 ), ( 2, 1 ), ( 2, 2 ) ]
+    assert signed_area( clipped ) == 1
+
+    # The winding of the polygon is kept whichever way the clip winds
+    clipped = clip_polygon( square[ : : -1 ], SQUARE[ : : -1 ] )
+    assert sorted( _points( clipped ) ) == [ ( 1, 1 ), ( 1, 2 ), ( 2, 1 ), ( 2, 2 ) ]
+    assert signed_area( clipped ) == -1
+
+
+def test_clip_polygon_inside_and_outside():
+    inside = [ Point( 0.5, 0.5 ), Point( 1.5, 0.5 ), Point( 1, 1.5 ) ]
+    assert clip_polygon( inside + inside[ : 1 ], SQUARE ) == inside
+    assert not clip_polygon( [ Point( 5, 5 ), Point( 6, 5 ), Point( 6, 6 ) ], SQUARE )
+
+
+def test_clip_line_through():
+    assert [ _points( line ) for line in clip_polyline( [ Point( -1, 1 ), Point( 3, 1 ) ], SQUARE ) ] == [
+        [ ( 0, 1 ), ( 2, 1 ) ],
+    ]
+
+
+def test_clip_polyline_leaving_and_entering():
+    points = [ Point( -1, 1 ), Point( 1, 1 ), Point( 1, 3 ), Point( 1.5, 1.5 ), Point( 3, 1.5 ) ]
+    first, second = clip_polyline( points, SQUARE )
+    assert _points( first ) == [ ( 0, 1 ), ( 1, 1 ), ( 1, 2 ) ]
+    assert _points( second ) == [ ( pytest.approx( 4 / 3 ), 2 ), ( 1.5, 1.5 ), ( 2, 1.5 ) ]
+
+
+def test_clip_single_point():
+    assert _points( clip_polyline( [ Point( 1, 1 ) ], SQUARE )[ 0 ] ) == [ ( 1, 1 ) ]
+    assert not clip_polyline( [ Point( 5, 1 ) ], SQUARE )
+    assert not clip_polyline( [ Point( 3, -1 ), Point( 3, 3 ) ], SQUARE )
+
+#----------------------------------------------------------------------------
@@ -0,0 +1,47 @@
+'''
+Known answer tests for removing the points in the middle of straight runs.
+'''
+
+import math
+
+from svg2mod import svg
+from svg2mod.svg2mod import PolygonSegment
+
+#----------------------------------------------------------------------------
+
+def _distance( point, p, q ):
+    dx, dy = q.x - p.x, q.y - p.y
+    t = max( 0, min( 1, ( ( point.x - p.x ) * dx + ( point.y - p.y ) * dy ) / ( dx * dx + dy * dy ) ) )
+    return math.hypot( point.x - p.x - t * dx, point.y - p.y - t * dy )
+
+
+def _drop( points, tolerance ):
+    return PolygonSegment._drop_collinear( points, tolerance ) # pylint: disable=protected-access
+
+#----------------------------------------------------------------------------
+
+def test_straight_run():
+    points = [ svg.Point( x, 0 ) for x in range( 10 ) ] + [ svg.Point( 9, 5 ) ]
+    assert _drop( points, 0.01 ) == [ points[ 0 ], points[ 9 ], points[ 10 ] ]
+
+
+def test_reversal_is_kept():
+    points = [ svg.Point( 0, 0 ), svg.Point( 4, 0 ), svg.Point( 2, 0 ), svg.Point( 2, 3 ) ]
+    assert _drop( points, 0.01 ) == points
+
+
+def test_long_shallow_arc_stays_within_tolerance():
+    # Every step is well within the tolerance of a straight line but the
+    # arc as a whole bends much further than that
+    radius, tolerance = 1000, 0.5
+    points = [
+        svg.Point( radius * math.sin( a / 2000 ), radius * ( 1 - math.cos( a / 2000 ) ) )
+        for a in range( 401 )
+    ]
+    kept = _drop( points, tolerance )
+    assert kept[ 0 ] is points[ 0 ] and kept[ -1 ] is points[ -1 ]
+    assert 2 < len( kept ) < len( points ) / 10
+    for point in points:
+        assert min( _distance( point, p, q ) for p, q in zip( kept, kept[ 1 : ] ) ) <= tolerance
+
+#----------------------------------------------------------------------------
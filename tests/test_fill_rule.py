@@ -0,0 +1,52 @@
+'''
+Tests for warning when the holes of a filled shape ignore its fill-rule.
+'''
+
+import logging
+
+import pytest
+
+from svg2mod.exporter import Svg2ModExportLatest
+from svg2mod.importer import Svg2ModImport
+
+#----------------------------------------------------------------------------
+
+SVG = '''<svg xmlns="http://www.w3.org/2000/svg"
+  xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"
+  width="20mm" height="20mm" viewBox="0 0 20 20">
+  <g inkscape:label="F.SilkS" inkscape:groupmode="layer">
+    <path id="shape" fill="#000000" {} d="M 0 0 L 10 0 L 10 10 L 0 10 Z {}"/>
+  </g>
+</svg>
+'''
+
+SAME = "M 2 2 L 8 2 L 8 8 L 2 8 Z"
+OPPOSITE = "M 2 2 L 2 8 L 8 8 L 8 2 Z"
+
+
+@pytest.fixture( name = "warnings" )
+def fixture_warnings( tmp_path, caplog ):
+
+    def warnings( inner, fill_rule = "", merge_fills = False ):
+        file_name = tmp_path / "shape.svg"
+        file_name.write_text( SVG.format( fill_rule, inner ) )
+        caplog.clear()
+        with caplog.at_level( logging.WARNING, logger = "svg2mod" ):
+            Svg2ModExportLatest( Svg2ModImport( str( file_name ) ), merge_fills = merge_fills ).write()
+        return [ record for record in caplog.records if "fill-rule" in record.getMessage() ]
+
+    return warnings
+
+#----------------------------------------------------------------------------
+
+def test_same_direction_hole_warns( warnings ):
+    assert len( warnings( SAME ) ) == 1
+    assert len( warnings( SAME, 'fill-rule="nonzero"' ) ) == 1
+
+
+def test_fill_rule_that_is_followed_does_not_warn( warnings ):
+    assert not warnings( OPPOSITE )
+    assert not warnings( SAME, 'fill-rule="evenodd"' )
+    assert not warnings( SAME, merge_fills = True )
+
+#----------------------------------------------------------------------------
@@ -0,0 +1,64 @@
+'''
+Known answer tests for finding self crossing outlines with --validate.
+'''
+
+import random
+
+from svg2mod import svg
+from svg2mod.svg2mod import PolygonSegment, SweepLine
+
+#----------------------------------------------------------------------------
+
+def _crossing( ring ):
+    point = PolygonSegment.find_crossing( [ svg.Point( x, y ) for x, y in ring ] )
+    return None if point is None else ( point.x, point.y )
+
+#----------------------------------------------------------------------------
+
+def test_square():
+    assert _crossing( [ ( 0, 0 ), ( 1, 0 ), ( 1, 1 ), ( 0, 1 ), ( 0, 0 ) ] ) is None
+    assert _crossing( [ ( 0, 0 ), ( 1, 0 ), ( 1, 1 ), ( 0, 1 ) ] ) is None
+
+
+def test_bowtie():
+    assert _crossing( [ ( 0, 0 ), ( 1, 1 ), ( 1, 0 ), ( 0, 1 ) ] ) == ( 0.5, 0.5 )
+
+
+def test_keyhole():
+    # Both sides of the line connecting the hole only touch
+    assert _crossing( [
+        ( 0, 0 ), ( 8, 0 ), ( 8, 8 ), ( 4, 8 ), ( 4, 6 ), ( 3, 6 ), ( 3, 4 ), ( 5, 4 ), ( 5, 6 ),
+        ( 4, 6 ), ( 4, 8 ), ( 0, 8 ), ( 0, 0 ),
+    ] ) is None
+
+
+def test_touching_within_the_resolution():
+    assert _crossing( [
+        ( 0, 0 ), ( 0.5, 0.25 ), ( 1, 0 ), ( 1, 1 ), ( 0.5, 1.0000001 ), ( 0.5, 0.25 ), ( 0, 1 ),
+    ] ) is None
+
+
+def test_vertical_and_horizontal_edges():
+    assert _crossing( [ ( 0, 0 ), ( 2, 0 ), ( 2, 2 ), ( 0, 2 ), ( 0, 1 ), ( 3, 1 ), ( 3, 3 ), ( -1, 3 ) ] ) == ( 2, 1 )
+    assert _crossing( [ ( 0, 0 ), ( 4, 0 ), ( 4, 2 ), ( 2, 2 ), ( 2, -2 ), ( 1, -2 ), ( 1, 4 ), ( 0, 4 ) ] ) in (
+        ( 1, 0 ), ( 2, 0 ),
+    )
+
+
+def test_sweep_line_order():
+    edges = list( range( 200 ) )
+    random.Random( 1 ).shuffle( edges )
+    sweep = SweepLine( len( edges ), lambda a, b: a > b )
+    for edge in edges:
+        sweep.add( edge )
+    for edge in edges[ : 100 ]:
+        sweep.remove( edge )
+
+    kept = sorted( edges[ 100 : ] )
+    assert sweep.neighbor_below( kept[ 0 ] ) is None
+    assert sweep.neighbor_above( kept[ -1 ] ) is None
+    for low, high in zip( kept, kept[ 1 : ] ):
+        assert sweep.neighbor_above( low ) == high
+        assert sweep.neighbor_below( high ) == low
+
+#----------------------------------------------------------------------------
@@ -0,0 +1,155 @@
+'''
+Known answer tests for merging overlapping filled shapes with PolygonUnion.
+'''
+
+from svg2mod import svg
+from svg2mod.svg2mod import PolygonSegment, PolygonUnion
+
+#----------------------------------------------------------------------------
+
+def _polygon( ring ):
+    return PolygonSegment( [ svg.Point( x, y ) for x, y in ring + ring[ : 1 ] ] )
+
+
+def _union( shapes, resolution = 1e-3 ):
+    union = PolygonUnion( resolution )
+    for rings, fill_rule in shapes:
+        union.add( [ _polygon( ring ) for ring in rings ], fill_rule )
+    return union.nest()
+
+
+def _area( points ):
+    return sum( p.x * q.y - q.x * p.y for p, q in zip( points, points[ 1 : ] ) ) / 2
+
+
+def _winding( ring, x, y ):
+    winding = 0
+    for ( x1, y1 ), ( x2, y2 ) in zip( ring, ring[ 1 : ] + ring[ : 1 ] ):
+        side = ( x2 - x1 ) * ( y - y1 ) - ( x - x1 ) * ( y2 - y1 )
+        if y1 <= y < y2 and side > 0:
+            winding += 1
+        elif y2 <= y < y1 and side < 0:
+            winding -= 1
+    return winding
+
+
+def _near_edge( shapes, x, y, distance = 2e-3 ):
+    for rings, _ in shapes:
+        for ring in rings:
+            for ( x1, y1 ), ( x2, y2 ) in zip( ring, ring[ 1 : ] + ring[ : 1 ] ):
+                dx, dy = x2 - x1, y2 - y1
+                t = max( 0, min( 1, ( ( x - x1 ) * dx + ( y - y1 ) * dy ) / ( dx * dx + dy * dy ) ) )
+                if ( x - x1 - t * dx ) ** 2 + ( y - y1 - t * dy ) ** 2 < distance ** 2:
+                    return True
+    return False
+
+
+def _uncovered( shapes, tree, size = 9, samples = 40 ):
+    ''' Return how many sample points are covered differently by the union '''
+
+    rings = [
+        [ ( p.x, p.y ) for p in polygon.points[ : -1 ] ]
+        for outline, holes in tree for polygon in [ outline ] + holes
+    ]
+    wrong = 0
+    for i in range( samples ):
+        for j in range( samples ):
+            x = ( i + 0.37 ) * size / samples
+            y = ( j + 0.61 ) * size / samples
+            if _near_edge( shapes, x, y ):
+                continue
+            expected = any(
+                sum( _winding( ring, x, y ) for ring in rings_ ) % 2 == 1 if fill_rule == "evenodd"
+                else sum( _winding( ring, x, y ) for ring in rings_ ) != 0
+                for rings_, fill_rule in shapes
+            )
+            if expected != ( sum( _winding( ring, x, y ) for ring in rings ) % 2 == 1 ):
+                wrong += 1
+    return wrong
+
+#----------------------------------------------------------------------------
+
+def test_overlapping_squares():
+    tree = _union( [
+        ( [ [ ( 0, 0 ), ( 2, 0 ), ( 2, 2 ), ( 0, 2 ) ] ], "nonzero" ),
+        ( [ [ ( 1, 1 ), ( 3, 1 ), ( 3, 3 ), ( 1, 3 ) ] ], "nonzero" ),
+    ] )
+    assert len( tree ) == 1
+    outline, holes = tree[ 0 ]
+    assert not holes
+    assert abs( _area( outline.points ) ) == 7
+    assert len( outline.points ) == 9
+
+
+def test_squares_touching_at_a_corner():
+    tree = _union( [
+        ( [ [ ( 0, 0 ), ( 1, 0 ), ( 1, 1 ), ( 0, 1 ) ] ], "nonzero" ),
+        ( [ [ ( 1, 1 ), ( 2, 1 ), ( 2, 2 ), ( 1, 2 ) ] ], "nonzero" ),
+    ] )
+    assert sorted( abs( _area( outline.points ) ) for outline, _ in tree ) == [ 1, 1 ]
+
+
+def test_evenodd_hole():
+    tree = _union( [
+        ( [ [ ( 0, 0 ), ( 4, 0 ), ( 4, 4 ), ( 0, 4 ) ], [ ( 1, 1 ), ( 3, 1 ), ( 3, 3 ), ( 1, 3 ) ] ], "evenodd" ),
+        ( [ [ ( 5, 0 ), ( 6, 0 ), ( 6, 1 ), ( 5, 1 ) ] ], "nonzero" ),
+    ] )
+    areas = sorted( ( abs( _area( outline.points ) ), [ abs( _area( hole.points ) ) for hole in holes ] )
+                    for outline, holes in tree )
+    assert areas == [ ( 1, [] ), ( 16, [ 4 ] ) ]
+
+
+def test_link_splits_loops_at_shared_vertices():
+    # Two squares touching at (1, 1) given as a single figure eight walk
+    boundary = [
+        ( ( 0, 0 ), ( 1, 0 ) ), ( ( 1, 0 ), ( 1, 1 ) ), ( ( 1, 1 ), ( 2, 1 ) ), ( ( 2, 1 ), ( 2, 2 ) ),
+        ( ( 2, 2 ), ( 1, 2 ) ), ( ( 1, 2 ), ( 1, 1 ) ), ( ( 1, 1 ), ( 0, 1 ) ), ( ( 0, 1 ), ( 0, 0 ) ),
+    ]
+    rings = PolygonUnion._link( boundary ) # pylint: disable=protected-access
+    assert sorted( sorted( ring ) for ring in rings ) == [
+        [ ( 0, 0 ), ( 0, 1 ), ( 1, 0 ), ( 1, 1 ) ],
+        [ ( 1, 1 ), ( 1, 2 ), ( 2, 1 ), ( 2, 2 ) ],
+    ]
+
+
+def test_link_drops_rings_thinner_than_a_step():
+    boundary = [ ( ( 0, 4 ), ( 0, 0 ) ), ( ( 0, 0 ), ( -1, -1 ) ), ( ( -1, -1 ), ( 0, 4 ) ) ]
+    assert not PolygonUnion._link( boundary ) # pylint: disable=protected-access
+
+
+def test_drop_spikes():
+    points = [ svg.Point( x, y ) for x, y in [
+        ( 0, 0 ), ( 4, 0 ), ( 4, 2 ), ( 4, 6 ), ( 4, 2 ), ( 4, 4 ), ( 0, 4 ), ( 0, 0 ),
+    ] ]
+    assert [ ( p.x, p.y ) for p in PolygonSegment.drop_spikes( points, 0.5 ) ] == [
+        ( 0, 0 ), ( 4, 0 ), ( 4, 2 ), ( 4, 4 ), ( 0, 4 ), ( 0, 0 ),
+    ]
+    # Connecting lines to holes are not spikes
+    keyhole = [ svg.Point( x, y ) for x, y in [
+        ( 0, 0 ), ( 8, 0 ), ( 8, 8 ), ( 4, 8 ), ( 4, 6 ), ( 3, 6 ), ( 3, 4 ), ( 5, 4 ), ( 5, 6 ),
+        ( 4, 6 ), ( 4, 8 ), ( 0, 8 ), ( 0, 0 ),
+    ] ]
+    assert PolygonSegment.drop_spikes( keyhole, 0.5 ) == keyhole
+
+
+def test_many_overlapping_shapes_keep_their_area():
+    # Rounding the crossings to the grid used to leave crossing edges
+    # unsplit, and most of the union was dropped
+    shapes = [
+        ( [ [ ( 0, 5 ), ( 8, 7 ), ( 0, 5 ), ( 8, 2 ), ( 1, 0 ), ( 1, 8 ) ] ], "nonzero" ),
+        ( [ [ ( 7, 4 ), ( 5, 3 ), ( 2, 0 ), ( 8, 0 ) ] ], "evenodd" ),
+        ( [
+            [ ( 5, 6 ), ( 2, 5 ), ( 2, 2 ), ( 7, 4 ), ( 8, 6 ), ( 7, 4 ) ],
+            [ ( 7, 1 ), ( 0, 5 ), ( 8, 7 ), ( 0, 0 ) ],
+        ], "evenodd" ),
+        ( [
+            [ ( 4, 2 ), ( 6, 1 ), ( 5, 4 ), ( 8, 2 ), ( 7, 5 ), ( 0, 2 ) ],
+            [ ( 1, 4 ), ( 2, 7 ), ( 5, 2 ), ( 0, 2 ), ( 8, 3 ), ( 1, 8 ) ],
+        ], "evenodd" ),
+        ( [ [ ( 3, 5 ), ( 6, 3 ), ( 5, 6 ) ] ], "nonzero" ),
+        ( [ [ ( 7, 7 ), ( 4, 3 ), ( 6, 0 ) ], [ ( 5, 2 ), ( 1, 8 ), ( 4, 7 ), ( 0, 2 ), ( 2, 8 ) ] ], "evenodd" ),
+    ]
+    assert _uncovered( shapes, _union( shapes ) ) == 0
+    assert _uncovered( shapes[ : 4 ], _union( shapes[ : 4 ] ) ) == 0
+
+#----------------------------------------------------------------------------
@@ -0,0 +1,45 @@
+'''
+Tests for the limits protecting a conversion from hostile svg files.
+'''
+
+import xml.etree.ElementTree as etree
+
+import pytest
+
+from svg2mod import svg
+
+#----------------------------------------------------------------------------
+
+@pytest.fixture( autouse = True )
+def fixture_limits( monkeypatch ):
+    for name in ( "max_elements", "max_path_commands", "max_vertices", "max_stage_time" ):
+        monkeypatch.setattr( svg.ResourceLimits, name, None )
+    svg.ResourceLimits.start_stage( "test" )
+
+#----------------------------------------------------------------------------
+
+def test_path_stops_reading_at_the_limit( monkeypatch ):
+    monkeypatch.setattr( svg.ResourceLimits, "max_path_commands", 100 )
+    with pytest.raises( svg.ResourceLimitError ):
+        svg.Path().parse( "M0 0" + " L1 1" * 100000 )
+    # Only one token past the limit was read
+    assert svg.ResourceLimits.path_commands == 101
+
+
+def test_path_within_the_limit( monkeypatch ):
+    monkeypatch.setattr( svg.ResourceLimits, "max_path_commands", 6 )
+    path = svg.Path()
+    path.parse( "M0 0 L1 1" )
+    assert svg.ResourceLimits.path_commands == 6
+    assert len( path.items ) == 2
+
+
+def test_ellipse_bbox_does_not_use_the_vertex_budget( monkeypatch ):
+    monkeypatch.setattr( svg.ResourceLimits, "max_vertices", 1000 )
+    ellipse = svg.Ellipse( etree.fromstring( '<ellipse cx="5" cy="5" rx="4" ry="2"/>' ) )
+    ellipse.transform()
+    low, high = ellipse.bbox()
+    assert ( low.x, low.y, high.x, high.y ) == ( 1, 3, 9, 7 )
+    assert svg.ResourceLimits.vertices == 0
+
+#----------------------------------------------------------------------------
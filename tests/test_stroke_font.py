@@ -0,0 +1,62 @@
+'''
+Known answer tests for text written with the built-in stroke font.
+'''
+
+import re
+
+import pytest
+
+from svg2mod import svg
+from svg2mod.exporter import Svg2ModExportLatest, Svg2ModExportPretty
+from svg2mod.importer import Svg2ModImport
+
+#----------------------------------------------------------------------------
+
+SVG = '''<svg xmlns="http://www.w3.org/2000/svg"
+  xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"
+  width="40mm" height="20mm" viewBox="0 0 40 20">
+  <g inkscape:label="F.SilkS" inkscape:groupmode="layer">
+    <text x="5" y="5" font-size="10" fill="#000000">{}</text>
+  </g>
+</svg>
+'''
+
+LINE = r"\(fp_line\s+\(start ([-\d.e]+) ([-\d.e]+)\)\s+\(end ([-\d.e]+) ([-\d.e]+)\)"
+
+
+@pytest.fixture( name = "convert" )
+def fixture_convert( tmp_path, monkeypatch ):
+    monkeypatch.setattr( svg.Text, "use_stroke_font", True )
+
+    def convert( text, exporter = Svg2ModExportLatest ):
+        file_name = tmp_path / "text.svg"
+        file_name.write_text( SVG.format( text ) )
+        exported = exporter( Svg2ModImport( str( file_name ) ) )
+        exported.write()
+        return exported.raw_file_data
+
+    return convert
+
+#----------------------------------------------------------------------------
+
+@pytest.mark.parametrize( "exporter", [ Svg2ModExportLatest, Svg2ModExportPretty ] )
+def test_strokes_are_not_closed( convert, exporter ):
+    output = convert( "L", exporter )
+    assert "fp_poly" not in output
+    lines = re.findall( LINE, output )
+    assert len( lines ) == 2
+    # The vertical stroke of the L ends where the horizontal one starts
+    ( _, _, x, y ), ( start_x, start_y, _, _ ) = lines
+    assert ( x, y ) == ( start_x, start_y )
+
+
+def test_closed_glyphs_keep_their_strokes( convert ):
+    output = convert( "O" )
+    assert "fp_poly" not in output
+    lines = re.findall( LINE, output )
+    # Every stroke starts where the last one ended, back around to the first
+    assert len( lines ) > 2
+    for ( _, _, x, y ), ( start_x, start_y, _, _ ) in zip( lines, lines[ 1 : ] + lines[ : 1 ] ):
+        assert ( x, y ) == ( start_x, start_y )
+
+#----------------------------------------------------------------------------